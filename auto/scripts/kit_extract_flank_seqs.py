@@ -1,6 +1,7 @@
 import os
+import logging
 import pandas as pd
-from Bio import SeqIO
+from Bio.SeqIO.FastaIO import SimpleFastaParser
 import gzip
 from concurrent.futures import ProcessPoolExecutor, as_completed
 
@@ -9,6 +10,16 @@ output_dir = '/work/zhangrh/couple_procject/result/cas9/fasta/step4_sup'
 log_file_path = '/work/zhangrh/couple_procject/result/cas9/array/sup.log'
 check_dir = '/work/zhangrh/couple_procject/result/cas9/array/crt'  # 用于检查已有文件的文件夹
 
+# 单个常驻 FileHandler（自带锁，线程安全），取代每条消息 open/close 一次日志文件
+logger = logging.getLogger('flank')
+_log_handler = logging.FileHandler(log_file_path)
+_log_handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+logger.addHandler(_log_handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+# 启动时一次性列出 check_dir，避免每个 target 单独 stat
+EXISTING = set(os.listdir(check_dir)) if os.path.isdir(check_dir) else set()
+
 source_dict = {
     'archaea_assembly_summary': "/work/data_share/NCBI_zrh/archaea_assembly_summary/",
     'bacteria_assembly_summary': "/work/data_share/NCBI_zrh/bacteria_assembly_summary/",
@@ -25,27 +36,17 @@ source_dict = {
 # 读取表格
 step1_df = pd.read_table(r'/work/zhangrh/couple_procject/result/cas9/raw_data/step1_df_all_function_filtered_g2.tsv')
 step1_df = step1_df[step1_df['source']=='IMGM_metagenome']
-def decompress_gz_to_tmp(gz_file, suffix=".fna"):
-    """解压.gz文件到临时文件并返回路径"""
-    tmp_file = f"{gz_file}_tmp{suffix}"
-    with gzip.open(gz_file, 'rb') as f_in:
-        with open(tmp_file, 'wb') as f_out:
-            f_out.write(f_in.read())
-    return tmp_file
 import re
-from threading import Lock
+from functools import lru_cache
 
 # ========== GFF 缓存 ==========
-_GFF_CACHE = {}
-_GFF_LOCK = Lock()
+_GFF_ID_RE = re.compile(r'(?:^|;)ID=([^;]+)')
+_GFF_LOCUS_TAG_RE = re.compile(r'(?:^|;)locus_tag=([^;]+)')
 
+@lru_cache(maxsize=8)
 def load_gff_two_cols(gff_path: str) -> pd.DataFrame:
-    """只读需要的两列并缓存：genome(第0列), description(第8列)"""
-    with _GFF_LOCK:
-        df_cached = _GFF_CACHE.get(gff_path)
-        if df_cached is not None:
-            return df_cached
-
+    """读取 genome(第0列) 与 description(第8列)，抽取 ID= / locus_tag= 后只缓存 genome/tid/locus_tag 三列。
+    lru_cache 限制同时驻留的 GFF 数量，避免大批 MAG 时内存无界增长；调用方不得修改返回的 DataFrame"""
     df = pd.read_table(
         gff_path,
         sep='\t',
@@ -54,15 +55,14 @@ def load_gff_two_cols(gff_path: str) -> pd.DataFrame:
         usecols=[0, 8],
         names=['genome', 'description'],
         dtype={'genome': 'string', 'description': 'string'},
-        engine='c',
-        memory_map=True
+        engine='c'
     )
     # 压缩一下 genome 列，降低常驻内存
     df['genome'] = df['genome'].astype('category')
-
-    with _GFF_LOCK:
-        _GFF_CACHE[gff_path] = df
-    return df
+    # 每个 GFF 只做一次正则抽取，后续按 tid / locus_tag 精确匹配 target_name
+    df['tid'] = df['description'].str.extract(_GFF_ID_RE, expand=False)
+    df['locus_tag'] = df['description'].str.extract(_GFF_LOCUS_TAG_RE, expand=False)
+    return df[['genome', 'tid', 'locus_tag']]
 
 def process_target_file(group_df):
     """处理同一个 target_file 的所有行，输出一个文件（加速 GFF 处理版）"""
@@ -81,13 +81,9 @@ def process_target_file(group_df):
         base_name = target_file.replace('.faa', '')
         target_file_name = base_name + '.fna'
 
-    # 先检查 check_dir 是否有文件包含 base_name
-    try:
-        if os.path.exists(check_dir,base_name+'.crt.txt'):
-            return f"[跳过] 文件夹 {check_dir} 已存在包含 {base_name} 的文件"
-    except Exception:
-        # check_dir 不存在或无法读取时，按无匹配处理
-        pass
+    # 先检查 check_dir 是否已有 <base_name>.crt.txt（check_dir 不存在时 EXISTING 为空）
+    if (base_name + '.crt.txt') in EXISTING:
+        return f"[跳过] 文件夹 {check_dir} 已存在包含 {base_name} 的文件"
 
     fna_path_unz = os.path.join(source_dir, target_file_name)
     fna_path_gz = fna_path_unz + ".gz"
@@ -104,85 +100,72 @@ def process_target_file(group_df):
     if imgm_mask.any():
         gff_path = fna_path_unz.replace('fna', 'gff')
         try:
-            gff_df = load_gff_two_cols(gff_path)  # 只读 0/8 两列并缓存
+            gff_df = load_gff_two_cols(gff_path)  # 只读 0/8 两列，LRU 缓存
         except Exception as e:
-            msg = f"[失败] 读取GFF失败: {gff_path}，错误：{e}\n"
-            with open(log_file_path, 'a') as log_f:
-                log_f.write(msg)
+            msg = f"[失败] 读取GFF失败: {gff_path}，错误：{e}"
+            logger.exception(msg)
             return f"[失败] {target_file_name} 读取GFF失败，错误已记录"
 
-        # 本组内唯一 target_name
-        unique_targets = group_df.loc[imgm_mask, 'target_name'].dropna().unique().tolist()
-
-        # 分块避免正则过长
-        CHUNK = 200
-        for i in range(0, len(unique_targets), CHUNK):
-            chunk = unique_targets[i:i+CHUNK]
-            try:
-                pat = '|'.join(re.escape(t) for t in chunk)
-                candidate = gff_df[gff_df['description'].str.contains(pat, regex=True, na=False)]
-            except re.error:
-                candidate = gff_df  # 退化为全表候选
-
-            # 对每个 target 再做精确 contains（regex=False 避免特殊字符误伤）
-            for t in chunk:
-                matched = candidate.loc[
-                    candidate['description'].str.contains(t, regex=False, na=False),
-                    'genome'
-                ]
-                if not matched.empty:
-                    for g in matched.astype(str).unique().tolist():
-                        if g:
-                            genome_ids_set.add(g)
-
-    # 其它来源：直接从 target_name 推断
-    for _, row in group_df.loc[~imgm_mask].iterrows():
-        genome = "_".join(row['target_name'].split('_')[:-1])
-        if genome:
-            genome_ids_set.add(genome)
+        # 本组内唯一 target_name，与 GFF 的 tid / locus_tag 做一次哈希求交（取代逐 target 的 contains 扫描），
+        # 耗时只与 GFF 行数有关，与 target 数无关
+        unique_targets = set(group_df.loc[imgm_mask, 'target_name'].dropna())
+        hit_mask = gff_df['tid'].isin(unique_targets) | gff_df['locus_tag'].isin(unique_targets)
+        matched = gff_df.loc[hit_mask, 'genome']
+        genome_ids_set.update(g for g in matched.astype(str).unique() if g)
+
+    # 其它来源：直接从 target_name 推断（去掉最后一个 '_' 之后的部分；无 '_' 时为空串，跳过）
+    non_imgm_ids = group_df.loc[~imgm_mask, 'target_name'].str.rpartition('_', expand=False).str[0]
+    genome_ids_set.update(g for g in non_imgm_ids if g)
 
     print(f"[处理] {target_file_name}，包含 {len(genome_ids_set)} 个序列候选")
 
-    # ===================== 打开输入文件（原逻辑不变） =====================
+    # ===================== 打开输入文件（.gz 直接流式解压读取，不落临时文件） =====================
     if os.path.exists(fna_path_unz):
-        input_path = fna_path_unz
+        input_handle = open(fna_path_unz, 'r')
     elif os.path.exists(fna_path_gz):
-        try:
-            input_path = decompress_gz_to_tmp(fna_path_gz)
-        except Exception as e:
-            msg = f"[失败] 解压失败: {fna_path_gz}，错误：{e}\n"
-            with open(log_file_path, 'a') as log_f:
-                log_f.write(msg)
-            return f"[失败] {target_file_name} 解压失败，错误已记录"
+        # gzip.open 惰性打开，解压错误只会在扫描时抛出，由下方的失败清理统一处理
+        input_handle = gzip.open(fna_path_gz, 'rt')
     else:
-        msg = f"[未找到] {fna_path_unz} 或 {fna_path_gz}\n"
-        with open(log_file_path, 'a') as log_f:
-            log_f.write(msg)
-        return msg.strip()
+        msg = f"[未找到] {fna_path_unz} 或 {fna_path_gz}"
+        logger.error(msg)
+        return msg
 
-    # ===================== 扫描 FASTA 并写出（仅改为 set 查找） =====================
+    # ===================== 扫描 FASTA 并写出（SimpleFastaParser + set 查找，边读边写） =====================
+    # 先写临时文件，成功后再 os.replace 为正式输出；中途失败不会留下被“已存在”逻辑跳过的残缺文件
+    tmp_file = output_file + '.tmp'
     try:
-        records_to_write = []
-        with open(input_path, 'r') as f:
-            for record in SeqIO.parse(f, 'fasta'):
-                if record.id in genome_ids_set:
-                    records_to_write.append(record)
-
-        if records_to_write:
-            os.makedirs(os.path.dirname(output_file), exist_ok=True)
-            with open(output_file, 'w') as out_f:
-                SeqIO.write(records_to_write, out_f, 'fasta')
-            print(f"[成功] 写入 {len(records_to_write)} 条序列到 {output_file}")
-            return f"[成功] 写入 {len(records_to_write)} 条序列到 {output_file}"
+        n_written = 0
+        out_f = None
+        try:
+            with input_handle as f:
+                for title, seq in SimpleFastaParser(f):
+                    rid = title.split(None, 1)[0] if title else ''
+                    if rid not in genome_ids_set:
+                        continue
+                    if out_f is None:
+                        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+                        out_f = open(tmp_file, 'w')
+                    out_f.write(f">{title}\n")
+                    out_f.write(seq)
+                    out_f.write("\n")
+                    n_written += 1
+        finally:
+            if out_f is not None:
+                out_f.close()
+
+        if n_written:
+            os.replace(tmp_file, output_file)
+            print(f"[成功] 写入 {n_written} 条序列到 {output_file}")
+            return f"[成功] 写入 {n_written} 条序列到 {output_file}"
         else:
             msg = f"[警告] 没有匹配的序列在 {target_file_name} 中"
-            with open(log_file_path, 'a') as log_f:
-                log_f.write(msg + "\n")
+            logger.warning(msg)
             return msg
     except Exception as e:
-        msg = f"[失败] {target_file_name} 读取或写入失败，错误：{e}\n"
-        with open(log_file_path, 'a') as log_f:
-            log_f.write(msg)
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        msg = f"[失败] {target_file_name} 读取或写入失败，错误：{e}"
+        logger.exception(msg)
         return f"[失败] {target_file_name} 处理失败，错误已记录"
 
 # 按 target_file 分组并处理
@@ -196,8 +179,8 @@ def parallel_process(df, max_workers=32):
     from tqdm.auto import tqdm  # 放在函数内部，避免全局改动
     results = []
 
-    # 按 target_file 分组，生成独立副本
-    grouped = [(target_file, group_df.copy()) for target_file, group_df in df.groupby('target_file')]
+    # 按 target_file 分组；线程共享内存且 process_target_file 只读，无需逐组 copy
+    grouped = list(df.groupby('target_file'))
     total = len(grouped)
 
     if total == 0:
@@ -4,45 +4,124 @@
 import os
 import argparse
 import pandas as pd
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from pandas.api.types import union_categoricals
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+# HMMER domtblout 标准字段（22 固定列 + description）
+COLNAMES = [
+    "target_name", "target_accession", "tlen",
+    "query_name", "query_accession", "qlen",
+    "full_seq_Evalue", "full_seq_score", "full_seq_bias",
+    "domain_num", "domain_of", "c_Evalue", "i_Evalue",
+    "domain_score", "domain_bias",
+    "hmm_from", "hmm_to", "ali_from", "ali_to", "env_from", "env_to",
+    "acc", "description"
+]
+
+# 固定列显式 dtype：跳过类型推断并减小内存；E-value / score / bias / acc 按原文字符串保留，
+# 避免 float 解析后再写出时改变 hmmsearch 的文本（如 1.2e-30 -> 1.2000000000000001e-30，3e+02 -> 300.0）
+# query/accession 在所有文件里高度重复，解析时直接读成 category
+DTYPES = {
+    "target_name": "string", "target_accession": "category", "tlen": "int32",
+    "query_name": "category", "query_accession": "category", "qlen": "int32",
+    "full_seq_Evalue": "string", "full_seq_score": "string", "full_seq_bias": "string",
+    "domain_num": "int32", "domain_of": "int32", "c_Evalue": "string", "i_Evalue": "string",
+    "domain_score": "string", "domain_bias": "string",
+    "hmm_from": "int32", "hmm_to": "int32", "ali_from": "int32", "ali_to": "int32",
+    "env_from": "int32", "env_to": "int32", "acc": "string",
+}
+CATEGORY_COLS = [col for col, dtype in DTYPES.items() if dtype == "category"] + ["target_file"]
+
+
+def _read_descriptions(domtblout_path):
+    """description 为空格分隔的自由文本（prodigal 的 '# start # end # strand #' 也在其中），
+    comment='#' 会把它截断，因此单独用 maxsplit 快速取第 23 段"""
+    descriptions = []
+    with open(domtblout_path, 'r') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            parts = line.split(None, 22)
+            descriptions.append(' '.join(parts[22].split()) if len(parts) > 22 else '')
+    return descriptions
 
 
 # ========== 解析 domtblout 文件 ==========
 def parse_domtblout(domtblout_path):
     try:
-        with open(domtblout_path, 'r') as f:
-            lines = [line.strip() for line in f if not line.startswith('#') and line.strip()]
-        if not lines:
+        # 22 个固定列交给 pandas C 引擎解析
+        df = pd.read_csv(
+            domtblout_path,
+            sep=r'\s+',
+            comment='#',
+            header=None,
+            names=COLNAMES[:22],
+            usecols=range(22),
+            dtype=DTYPES,
+            engine='c'
+        )
+        if df.empty:
             return None
 
-        records = []
-        for line in lines:
-            parts = line.split()
-            if len(parts) < 22:
-                continue
-            fixed = parts[:22]
-            description = ' '.join(parts[22:])
-            fixed.append(description)
-            records.append(fixed)
-
-        colnames = [
-            "target_name", "target_accession", "tlen",
-            "query_name", "query_accession", "qlen",
-            "full_seq_Evalue", "full_seq_score", "full_seq_bias",
-            "domain_num", "domain_of", "c_Evalue", "i_Evalue",
-            "domain_score", "domain_bias",
-            "hmm_from", "hmm_to", "ali_from", "ali_to", "env_from", "env_to",
-            "acc", "description"
-        ]
-        df = pd.DataFrame(records, columns=colnames)
-        df['target_file'] = os.path.basename(domtblout_path)
+        descriptions = _read_descriptions(domtblout_path)
+        if len(descriptions) != len(df):
+            raise ValueError(f"description 行数({len(descriptions)})与表格行数({len(df)})不一致")
+        df['description'] = descriptions
+        df['target_file'] = pd.Categorical([os.path.basename(domtblout_path)] * len(df))
         return df
 
+    except pd.errors.EmptyDataError:
+        return None
     except Exception as e:
         print(f"❌ Error reading {domtblout_path}: {e}")
         return None
 
 
+def concat_categorical(dfs):
+    """先统一各文件的 category 取值再 concat，否则 pandas 会退化为 object 列"""
+    for col in CATEGORY_COLS:
+        categories = union_categoricals([df[col] for df in dfs]).categories
+        for df in dfs:
+            df[col] = df[col].cat.set_categories(categories)
+    return pd.concat(dfs, ignore_index=True)
+
+
+# ========== 查找 domtblout 文件 ==========
+def _scan_domtblout(root):
+    """os.scandir 迭代遍历，直接用 DirEntry 的类型与文件名判断，不额外 stat"""
+    found = []
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith('.domtblout'):
+                        found.append(entry.path)
+        except OSError as e:
+            print(f"⚠️ Cannot scan {current}: {e}")
+    return found
+
+
+def find_domtblout_files(root, threads):
+    """第一层子目录（每个 HMM 一个）并行遍历，冷缓存 / NFS 下可重叠目录读取延迟"""
+    found, subdirs = [], []
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.name.endswith('.domtblout'):
+                found.append(entry.path)
+    if subdirs:
+        with ThreadPoolExecutor(max_workers=max(1, min(threads, len(subdirs)))) as executor:
+            for files in executor.map(_scan_domtblout, subdirs):
+                found.extend(files)
+    return found
+
+
 # ========== 主函数 ==========
 def main(args):
     input_dir = args.input_dir
@@ -57,11 +136,7 @@ def main(args):
             continue
 
         print(f"🔍 Scanning directory: {full_results_dir}")
-        domtblout_files = []
-        for root, _, files in os.walk(full_results_dir):
-            for file in files:
-                if file.endswith('.domtblout'):
-                    domtblout_files.append(os.path.join(root, file))
+        domtblout_files = find_domtblout_files(full_results_dir, threads)
 
         print(f"📄 Found {len(domtblout_files)} .domtblout files")
 
@@ -71,7 +146,8 @@ def main(args):
 
         merged_df_list = []
 
-        with ProcessPoolExecutor(max_workers=threads) as executor:
+        # 解析以 I/O 为主，用线程池避免进程间 pickle 大量结果
+        with ThreadPoolExecutor(max_workers=threads) as executor:
             futures = {executor.submit(parse_domtblout, path): path for path in domtblout_files}
             for future in as_completed(futures):
                 df = future.result()
@@ -79,7 +155,7 @@ def main(args):
                     merged_df_list.append(df)
 
         if merged_df_list:
-            merged_df = pd.concat(merged_df_list, ignore_index=True)
+            merged_df = concat_categorical(merged_df_list)
             output_file = os.path.join(output_dir, f"{results_dir}_domtblout_merged.tsv")
             merged_df.to_csv(output_file, sep='\t', index=False)
             print(f"✅ Written to: {output_file}")
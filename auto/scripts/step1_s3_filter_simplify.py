@@ -7,19 +7,16 @@ import argparse
 import pandas as pd
 
 
-def get_position(description):
-    match = re.findall(r"#\s*(\d+)\s*#\s*(\d+)\s*#\s*(-?\d+)\s*#", description)
-    if match:
-        return tuple(map(int, match[0]))
-    else:
-        return (None, None, None)
+# prodigal description: "# start # end # strand # ID=..."
+POSITION_RE = re.compile(r"#\s*(\d+)\s*#\s*(\d+)\s*#\s*(-?\d+)\s*#")
 
 
 def process_single_file(path, score_cutoff):
     df = pd.read_table(path)
     df = df[df['full_seq_score'].astype(float) > score_cutoff].copy()
     df['source'] = os.path.basename(path).replace('_domtblout_merged.tsv', '')
-    df[['prot_start', 'prot_end', 'strand']] = df['description'].apply(lambda x: pd.Series(get_position(x)))
+    pos = df['description'].astype(str).str.extract(POSITION_RE)
+    df[['prot_start', 'prot_end', 'strand']] = pos.astype('Int64')
 
     filtered_out = path.replace('_domtblout_merged.tsv', '_domtblout_merged_filtered.tsv')
     df.to_csv(filtered_out, sep='\t', index=False)
@@ -28,7 +25,8 @@ def process_single_file(path, score_cutoff):
     for id_, group in df.groupby("target_name"):
         result = {
             'target_name': id_,
-            'query_names': group['query_name'].tolist(),
+            # query_names / domain_mdl_hit_coverage 用 '|' 拼接，下游可直接 str.split，无需 literal_eval
+            'query_names': '|'.join(group['query_name']),
             'full_seq_Evalue': group['full_seq_Evalue'].tolist(),
             'full_seq_score': group['full_seq_score'].tolist(),
             'full_seq_bias': group['full_seq_bias'].tolist(),
@@ -42,14 +40,16 @@ def process_single_file(path, score_cutoff):
             'prot_end': group['prot_end'].iloc[0],
             'strand': group['strand'].iloc[0],
             'domain_alignment_positions': list(zip(group['env_from'], group['env_to'])),
-            'domain_mdl_hit_coverage': ((group['env_to'] - group['env_from']) / group['qlen']).tolist(),
+            'domain_mdl_hit_coverage': '|'.join(map(str, ((group['env_to'] - group['env_from']) / group['qlen']).tolist())),
             'source': group['source'].iloc[0]
         }
         results.append(result)
 
+    summary_df = pd.DataFrame(results)
     summary_out = path.replace('_domtblout_merged.tsv', '_summary.tsv')
-    pd.DataFrame(results).to_csv(summary_out, sep='\t', index=False)
+    summary_df.to_csv(summary_out, sep='\t', index=False)
     print(f"✅ Processed {os.path.basename(path)} → {os.path.basename(summary_out)}")
+    return df, summary_df
 
 
 def main(args):
@@ -57,18 +57,15 @@ def main(args):
     output_prefix = args.output_prefix
     score_cutoff = args.score_cutoff
 
-    # 处理每个 *_merged.tsv 文件
+    # 处理每个 *_merged.tsv 文件，summary 直接在内存中收集（不再回读 *_summary.tsv）
+    summaries = []
     for file in os.listdir(input_dir):
         if file.endswith('_domtblout_merged.tsv'):
             full_path = os.path.join(input_dir, file)
-            process_single_file(full_path, score_cutoff)
+            _, summary_df = process_single_file(full_path, score_cutoff)
+            summaries.append(summary_df)
 
-    # 合并所有 *_summary.tsv
-    combined = pd.DataFrame()
-    for file in os.listdir(input_dir):
-        if file.endswith('_summary.tsv'):
-            df = pd.read_table(os.path.join(input_dir, file))
-            combined = pd.concat([combined, df], ignore_index=True)
+    combined = pd.concat(summaries, ignore_index=True) if summaries else pd.DataFrame()
 
     final_out = f"{output_prefix}.tsv"
     combined.to_csv(final_out, sep='\t', index=False)
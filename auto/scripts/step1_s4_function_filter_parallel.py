@@ -1,12 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from tqdm import tqdm
-import ast
 import argparse
 import pandas as pd
-import ast
-from concurrent.futures import ProcessPoolExecutor
 
 
 def main(args):
@@ -14,50 +9,38 @@ def main(args):
 
     df = df[df['tlen'] > args.min_target_len].copy()
 
-    filter_df1 = df[df['query_names'].apply(lambda x: all(keyword in x for keyword in args.and_filters))]
-    filter_df1_list = filter_df1['target_name'].tolist()
+    # query_names 只解析一次为集合，AND/ANY 用集合的 issubset / isdisjoint 判断
+    qn_sets = df['query_names'].astype(str).map(lambda s: set(s.split('|')))
+    and_set = set(args.and_filters)
+    any_set = set(args.any_filters)
 
-    filter_df2 = df[df['query_names'].apply(lambda x: any(keyword in x for keyword in args.any_filters))]
-    filter_df2_list = filter_df2['target_name'].tolist()
+    and_ids = set(df.loc[qn_sets.map(and_set.issubset), 'target_name'])
+    any_ids = set(df.loc[qn_sets.map(lambda s: not s.isdisjoint(any_set)), 'target_name'])
 
-    print(f"✅ Filtered {len(filter_df1_list)} targets with AND filters")
-    print(f"✅ Filtered {len(filter_df2_list)} targets with ANY filters")
+    print(f"✅ Filtered {len(and_ids)} targets with AND filters")
+    print(f"✅ Filtered {len(any_ids)} targets with ANY filters")
 
-    filter_df = pd.concat([filter_df1, filter_df2]).drop_duplicates()
-    filter_df['query_names'] = filter_df['query_names'].apply(ast.literal_eval)
-    filter_df['domain_mdl_hit_coverage'] = filter_df['domain_mdl_hit_coverage'].apply(ast.literal_eval)
+    # 直接按 id 集合取行，避免 concat + drop_duplicates 整表去重
+    filter_df = df[df['target_name'].isin(and_ids | any_ids)].copy()
+    # step1_s3 以 '|' 拼接写出，这里用向量化 str.split 还原为列表
+    filter_df['query_names'] = filter_df['query_names'].astype(str).str.split('|')
+    filter_df['domain_mdl_hit_coverage'] = filter_df['domain_mdl_hit_coverage'].astype(str).str.split('|').map(
+        lambda xs: [float(x) for x in xs]
+    )
 
-    coverage_check_ids = [id_ for id_ in filter_df2_list if id_ not in filter_df1_list]
-
-    def coverage_filter(row, conditions, threshold):
-
-        for condition in conditions:
-            if condition in row['query_names']:
-                indices = [i for i, x in enumerate(row['query_names']) if x == condition]
-                coverage_values = [row['domain_mdl_hit_coverage'][i] for i in indices]
-                if any(cov > threshold for cov in coverage_values):
-                    return True
-        return False
-
-    def parallel_filter(df, coverage_check_ids, conditions, threshold, threads):
-        keep_rows = df[~df['target_name'].isin(coverage_check_ids)].index.tolist()
-
-        with ProcessPoolExecutor(max_workers=threads) as executor:
-            futures = {
-                executor.submit(coverage_filter, row, conditions, threshold): idx
-                for idx, row in df[df['target_name'].isin(coverage_check_ids)].iterrows()
-            }
-
-            for future in tqdm(as_completed(futures), total=len(futures), desc="Processing rows"):
-                idx = futures[future]
-                if future.result():
-                    keep_rows.append(idx)
-
-        return df.loc[keep_rows]
-
-    filter_df = parallel_filter(filter_df, coverage_check_ids, args.any_filters, args.cov_threshold, args.threads)
+    coverage_check_ids = any_ids - and_ids
 
+    def coverage_filter(df, coverage_check_ids, conditions, threshold):
+        """向量化：explode 后按 query_name ∈ conditions 且覆盖度 > threshold 标记，
+        coverage_check_ids 中至少有一个满足条件的结构域才保留，其余行直接保留"""
+        check_mask = df['target_name'].isin(coverage_check_ids)
+        sub = df.loc[check_mask, ['target_name', 'query_names', 'domain_mdl_hit_coverage']]
+        sub = sub.explode(['query_names', 'domain_mdl_hit_coverage'])
+        hit = sub['query_names'].isin(set(conditions)) & (sub['domain_mdl_hit_coverage'].astype(float) > threshold)
+        keep_ids = sub.loc[hit, 'target_name'].unique()
+        return df[~check_mask | df['target_name'].isin(keep_ids)]
 
+    filter_df = coverage_filter(filter_df, coverage_check_ids, args.any_filters, args.cov_threshold)
 
     filter_df.to_csv(args.output_file, sep='\t', index=False)
     print(f"✅ Filtered result saved to {args.output_file}")
@@ -77,7 +60,7 @@ if __name__ == '__main__':
         parser.add_argument('--and_filters', nargs='*', default=[], help='List of filters that must be present in query_names')
         parser.add_argument('--any_filters', nargs='*', default=[], help='List of filters that should be present in query_names')
 
-        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--threads', type=int, default=4, help='Kept for CLI compatibility; filtering is vectorized')
 
         return parser.parse_args()
 
@@ -8,7 +8,9 @@
 import argparse
 import sys
 import os
-from Bio import SeqIO
+import glob
+import shutil
+from Bio.SeqIO.FastaIO import SimpleFastaParser
 from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 
@@ -27,32 +29,30 @@ SOURCE_DICT = {
 }
 
 
-def extract_sequences(source, file_name, need_ids, log_file):
-    root = SOURCE_DICT.get(source)
-    if root is None:
-        print(f"[WARN] 未知 source: {source}", file=sys.stderr)
-        return []
+def _part_files(output_prefix):
+    return sorted(glob.glob(glob.escape(output_prefix) + ".part*.fasta"))
 
-    fasta_path = os.path.join(root, file_name)
-    if not os.path.exists(fasta_path):
-        print(f"[WARN] 文件不存在: {fasta_path}", file=sys.stderr)
-        return []
 
-    out_records = []
-    not_found = []
+def extract_sequences(source, file_name, need_ids, output_prefix):
+    """命中的序列直接追加写入本进程的分片文件 <output_prefix>.part<pid>.fasta，
+    只返回 (写出条数, 未找到的 ID 列表)，不回传 SeqRecord。
+    source/文件是否存在由主进程基于目录索引预先检查"""
+    fasta_path = os.path.join(SOURCE_DICT[source], file_name)
+    need_ids = set(need_ids)  # 本地副本，不修改调用方的集合
+    part_path = f"{output_prefix}.part{os.getpid()}.fasta"
+    n_written = 0
+    # 1MB 写缓冲，摊薄 write() 系统调用
+    with open(fasta_path, 'r') as handle, open(part_path, 'a', buffering=1 << 20) as out:
+        for title, seq in SimpleFastaParser(handle):
+            rec_id = title.split(None, 1)[0] if title else ''
+            if rec_id in need_ids:
+                out.write(f">{title}\n{seq}\n")
+                need_ids.discard(rec_id)
+                n_written += 1
+                if not need_ids:
+                    break  # 全部找到即停止，不再扫描剩余文件
 
-    for rec in SeqIO.parse(fasta_path, "fasta"):
-        if rec.id in need_ids:
-            out_records.append(rec)
-            need_ids.remove(rec.id)
-
-    not_found.extend(need_ids)
-    if not_found:
-        with open(log_file, 'a') as log:
-            for seq_id in not_found:
-                log.write(f"{source}\t{file_name}\t{seq_id}\n")
-
-    return out_records
+    return n_written, list(need_ids)
 
 
 def main(args):
@@ -68,16 +68,42 @@ def main(args):
     df['target_file'] = df['target_file'].str.replace(".domtblout", ".faa", regex=False)
     need_dict = df.groupby(["source", "target_file"])["target_name"].apply(set).to_dict()
 
+    # 清理上次中断遗留的分片
+    for stale in _part_files(output_prefix):
+        os.remove(stale)
+
+    # 每个用到的 source 目录只 listdir 一次，取代逐文件 stat
+    used_sources = {source for source, _ in need_dict}
+    dir_index = {src: set(os.listdir(root)) for src, root in SOURCE_DICT.items()
+                 if src in used_sources and os.path.isdir(root)}
+    tasks = {}
+    for (source, file_name), ids in need_dict.items():
+        if source not in SOURCE_DICT:
+            print(f"[WARN] 未知 source: {source}", file=sys.stderr)
+        elif file_name not in dir_index.get(source, ()):
+            print(f"[WARN] 文件不存在: {os.path.join(SOURCE_DICT[source], file_name)}", file=sys.stderr)
+        else:
+            tasks[(source, file_name)] = ids
+
     print(f"🚀 启动并行提取（线程数: {args.threads}）")
-    all_records = []
-    with ProcessPoolExecutor(max_workers=args.threads) as executor:
-        futures = [executor.submit(extract_sequences, source, file_name, ids.copy(), log_file)
-                   for (source, file_name), ids in need_dict.items()]
+    total = 0
+    with ProcessPoolExecutor(max_workers=args.threads) as executor, open(log_file, 'a') as log:
+        futures = {executor.submit(extract_sequences, source, file_name, ids, output_prefix): (source, file_name)
+                   for (source, file_name), ids in tasks.items()}
         for future in as_completed(futures):
-            all_records.extend(future.result())
+            source, file_name = futures[future]
+            n_written, not_found = future.result()
+            total += n_written
+            for seq_id in not_found:
+                log.write(f"{source}\t{file_name}\t{seq_id}\n")
 
-    print(f"🧬 提取完毕，共提取序列：{len(all_records):,} 条")
-    SeqIO.write(all_records, output_fasta, "fasta")
+    print(f"🧬 提取完毕，共提取序列：{total:,} 条")
+    # 各进程分片顺序拼接为最终 FASTA
+    with open(output_fasta, 'wb') as out:
+        for part in _part_files(output_prefix):
+            with open(part, 'rb') as f:
+                shutil.copyfileobj(f, out, 1 << 20)
+            os.remove(part)
     print(f"✅ 输出写入：{os.path.abspath(output_fasta)}")
 
 
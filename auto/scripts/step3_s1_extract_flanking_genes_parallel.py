@@ -7,10 +7,14 @@ import gzip
 import argparse
 import numpy as np
 import pandas as pd
-from typing import Dict, Tuple, Iterable, List
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from Bio import SeqIO
-from Bio.SeqRecord import SeqRecord
+from typing import Callable, Dict, Tuple, Iterable, List, NamedTuple
+from multiprocessing import Pool
+
+try:
+    # 可选依赖：ISA-L 加速的多线程 gzip 解压；未安装时回退到标准库 gzip
+    from isal import igzip_threaded  # type: ignore
+except ImportError:
+    igzip_threaded = None
 
 # ------------------------------
 # Helpers for IO & parsing
@@ -19,131 +23,333 @@ from Bio.SeqRecord import SeqRecord
 def _smart_open_fasta(path: str):
     """Return a text handle for FASTA path (supports .gz)."""
     if path.endswith('.gz'):
+        if igzip_threaded is not None:
+            return igzip_threaded.open(path, 'rt', threads=2, block_size=2 * 1024 * 1024)
         return gzip.open(path, 'rt')
     return open(path, 'r')
 
 
-def _iter_seqrecords(path: str) -> Iterable[SeqRecord]:
+class Record(NamedTuple):
+    """轻量 FASTA 记录：header 按第一个空白拆成 id / desc，seq 为去换行后的字符串"""
+    id: str
+    desc: str
+    seq: str
+
+
+def _fast_fasta_iter(handle) -> Iterable[Record]:
+    """逐行解析 FASTA，只拆一次 header，不构造 SeqRecord/Seq 对象"""
+    header = None
+    buf: List[str] = []
+    for line in handle:
+        if line.startswith('>'):
+            if header is not None:
+                yield Record(header[0], header[1] if len(header) > 1 else '', ''.join(buf))
+            header = line[1:].rstrip().split(None, 1)
+            if not header:
+                header = ['']
+            buf = []
+        elif header is not None:
+            buf.append(line.strip())
+    if header is not None:
+        yield Record(header[0], header[1] if len(header) > 1 else '', ''.join(buf))
+
+
+def _iter_range_lines(handle, start: int, end: int) -> Iterable[str]:
+    """从二进制句柄中取出 header 起始于 [start, end) 的记录所覆盖的行：
+    先对齐到 start 之后的第一个行首，遇到起始位置 >= end 的 header 行即停止"""
+    pos = start
+    if start > 0:
+        handle.seek(start - 1)
+        pos = start - 1 + len(handle.readline())
+    for line in handle:
+        if pos >= end and line.startswith(b'>'):
+            break
+        pos += len(line)
+        yield line.decode()
+
+
+def _iter_fasta_lines(path: str, byte_range: Tuple[int, int] | None = None) -> Iterable[str]:
+    """byte_range=(start, end) 时只给出 header 落在该字节区间内的记录所覆盖的行（仅支持未压缩文件），
+    供大文件按字节切分后并行扫描"""
+    if byte_range is not None:
+        with open(path, 'rb') as handle:
+            yield from _iter_range_lines(handle, *byte_range)
+        return
     with _smart_open_fasta(path) as handle:
-        for rec in SeqIO.parse(handle, 'fasta'):
-            yield rec
-
-
-def _possible_faa_paths(root_dir: str, base: str) -> List[str]:
-    """Return candidate FASTA paths given a root dir and basename without extension.
-    We try common extensions and their .gz variants.
-    """
-    exts = ['.faa', '.fasta', '.fa']
-    candidates = []
-    for ext in exts:
-        p = os.path.join(root_dir, base + ext)
-        candidates.append(p)
-        candidates.append(p + '.gz')
-    return candidates
-
-
-def _resolve_faa_path(root_dir: str, domtblout_basename: str) -> str | None:
+        yield from handle
+
+
+def _iter_seqrecords(path: str, byte_range: Tuple[int, int] | None = None) -> Iterable[Record]:
+    yield from _fast_fasta_iter(_iter_fasta_lines(path, byte_range))
+
+
+def _iter_genome_hits(lines: Iterable[str], genome_of_id: Callable[[str], str], wanted,
+                      assume_contiguous: bool = False) -> Iterable[Tuple[str, Record]]:
+    """按 genome 过滤的 FAA 扫描：header 行上只切出 id 判断 genome，命中后才拆 description；
+    非目标记录的序列行不缓存、不拼接，只为命中的记录构造 Record，产出 (genome, record)。
+    assume_contiguous=True 时，全部目标 genome 都出现过之后遇到非目标记录即停止"""
+    n_wanted = len(wanted)
+    started = set()
+    hit = None
+    buf: List[str] = []
+    for line in lines:
+        if line.startswith('>'):
+            if hit is not None:
+                yield hit[0], Record(hit[1], hit[2], ''.join(buf))
+                hit = None
+            # 常见 header 为 '>id desc'：find 定位第一个空格即得 id；其它形式退回 split
+            sp = line.find(' ')
+            rec_id = line[1:sp] if sp > 1 else ''
+            if not rec_id or '\t' in rec_id:
+                parts = line[1:].split(None, 1)
+                rec_id = parts[0] if parts else ''
+            genome = genome_of_id(rec_id)
+            if genome in wanted:
+                started.add(genome)
+                header = line[1:].rstrip().split(None, 1)
+                hit = (genome, rec_id, header[1] if len(header) > 1 else '')
+                buf = []
+            elif assume_contiguous and len(started) == n_wanted:
+                return
+        elif hit is not None:
+            buf.append(line.strip())
+    if hit is not None:
+        yield hit[0], Record(hit[1], hit[2], ''.join(buf))
+
+
+def _byte_ranges(path: str, n: int) -> List[Tuple[int, int]]:
+    """把文件按字节均分为 n 段；段边界不必落在记录边界上，由 _iter_range_lines 对齐"""
+    size = os.path.getsize(path)
+    bounds = [size * i // n for i in range(n + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(n) if bounds[i] < bounds[i + 1]]
+
+
+# 候选扩展名按优先级排列（与逐个 os.path.exists 探测的历史顺序一致）
+FAA_EXTS = ['.faa', '.faa.gz', '.fasta', '.fasta.gz', '.fa', '.fa.gz']
+
+
+def _build_faa_index(root_dir: str) -> Dict[str, str]:
+    """对 root_dir 做一次 listdir，建立 {basename: full_path}；同名多种扩展时按 FAA_EXTS 优先级取一个。
+    目录不存在时返回空字典"""
+    best: Dict[str, Tuple[int, str]] = {}
+    try:
+        names = os.listdir(root_dir)
+    except OSError:
+        return {}
+    for fn in names:
+        for rank, ext in enumerate(FAA_EXTS):
+            if fn.endswith(ext):
+                base = fn[:-len(ext)]
+                if base not in best or rank < best[base][0]:
+                    best[base] = (rank, os.path.join(root_dir, fn))
+                break
+    return {base: path for base, (_, path) in best.items()}
+
+
+def _resolve_faa_path(faa_index: Dict[str, str], domtblout_basename: str) -> str | None:
     """domtblout_basename is the filename without trailing ".domtblout".
-    We search for <basename>.faa/.fasta/.fa(.gz) under root_dir.
+    Look up <basename>.faa/.fasta/.fa(.gz) in the prebuilt directory index.
     """
-    base = domtblout_basename
-    for cand in _possible_faa_paths(root_dir, base):
-        if os.path.exists(cand):
-            return cand
-    return None
+    return faa_index.get(domtblout_basename)
 
 
 # ------------------------------
 # Source-specific parsers
 # ------------------------------
+# 每个解析函数一次扫描即可服务同一 FAA 中的多个 target：先按 genome/contig 分桶收集
+# {rec_id: (start, end, strand, record)}，再转成 SoA 的 SegTable，返回 {target_seqid: SegTable}，
+# 同一 genome 的 target 共享同一张表。
+
+# 模块级预编译的正则，避免在每次调用 / 每条记录中重复查找编译缓存
+_GZ_FAA_EXT_RE = re.compile(r'\.(fa|faa|fasta)\.gz$')
+_FAA_EXT_RE = re.compile(r'\.(fa|faa|fasta)$')
+_LOCUS_TAG_RE = re.compile(r"locus_tag=([^;]+)")
+_NUM_RE = re.compile(r'\d+')
+
+SegInfo = Dict[str, Tuple[int, int, int, Record]]
+
+
+class SegTable(NamedTuple):
+    """单个 genome 的片段信息（SoA 布局）：坐标放在并行的 int32 数组里，便于向量化筛选"""
+    ids: List[str]
+    starts: np.ndarray
+    ends: np.ndarray
+    strands: np.ndarray
+    records: List[Record]
+
+
+def _to_seg_table(fasta_info: SegInfo) -> SegTable:
+    values = list(fasta_info.values())
+    return SegTable(
+        ids=list(fasta_info.keys()),
+        starts=np.fromiter((v[0] for v in values), dtype=np.int32, count=len(values)),
+        ends=np.fromiter((v[1] for v in values), dtype=np.int32, count=len(values)),
+        strands=np.fromiter((v[2] for v in values), dtype=np.int32, count=len(values)),
+        records=[v[3] for v in values],
+    )
+
+
+EMPTY_SEG_TABLE = _to_seg_table({})
 
-def process_gff_faa(faa_path: str, target_seqid: str) -> Dict[str, Tuple[int, int, int, SeqRecord]]:
+
+def _target_tables(by_genome: Dict[str, SegInfo], genome_of: Dict[str, str],
+                   errors: Dict[str, str] | None = None) -> Dict[str, SegTable | str]:
+    """把按 genome 收集的字典转成 SegTable，并映射回每个 target_seqid（同一 genome 的 target 共享同一张表）。
+    errors 中的 genome（有记录解析失败）映射为 'ERROR:...' 字符串，只影响该 genome 的 target"""
+    errors = errors or {}
+    tables = {g: errors[g] if g in errors else _to_seg_table(info) for g, info in by_genome.items()}
+    return {sid: tables[g] for sid, g in genome_of.items()}
+
+
+def _prodigal_genome(seqid: str) -> str:
+    # 去掉最后一个 '_' 及其后的编号；rpartition 一次 C 调用，不构造中间列表
+    return seqid.rpartition('_')[0]
+
+
+def _translated_cds_genome(seqid: str) -> str:
+    return seqid.replace('lcl|', '').split('_prot_')[0]
+
+
+def process_gff_faa(faa_path: str, target_seqids: Iterable[str],
+                    byte_range: Tuple[int, int] | None = None) -> Dict[str, SegTable]:
     """For IMGM_metagenome-like sources with paired GFF.
     We infer the GFF path by swapping extension.
     """
     # Derive gff path robustly
     if faa_path.endswith('.gz'):
-        gff_path = re.sub(r'\.(fa|faa|fasta)\.gz$', '.gff', faa_path)
+        gff_path = _GZ_FAA_EXT_RE.sub('.gff', faa_path)
     else:
-        gff_path = re.sub(r'\.(fa|faa|fasta)$', '.gff', faa_path)
+        gff_path = _FAA_EXT_RE.sub('.gff', faa_path)
 
     if not os.path.exists(gff_path):
         raise FileNotFoundError(f"GFF not found for {faa_path}: {gff_path}")
 
-    gff_df = pd.read_table(gff_path, header=None, comment='#')
-    gff_df = gff_df.iloc[:, [0, 3, 4, 6, 8]].copy()
-    gff_df.columns = ['genome', 'start', 'end', 'strand', 'description']
-    pattern = r"locus_tag=([^;]+)"
-    gff_df['seqid'] = gff_df['description'].str.extract(pattern)
-
-    target_genome = gff_df.loc[gff_df['seqid'] == target_seqid, 'genome'].unique()
-    gff_df = gff_df[gff_df['genome'].isin(target_genome)]
-
-    fasta_info: Dict[str, Tuple[int, int, int, SeqRecord]] = {}
-    for record in _iter_seqrecords(faa_path):
-        rec_id = str(record.id)
-        if rec_id in set(gff_df['seqid']):
-            sub = gff_df[gff_df['seqid'] == rec_id]
-            # 预期只有一行；若多行，取第一行
-            start = int(sub['start'].iloc[0])
-            end = int(sub['end'].iloc[0])
-            strand = int(1 if str(sub['strand'].iloc[0]) == '+' else -1)
-            fasta_info[rec_id] = (start, end, strand, record)
-    return fasta_info
-
-
-def process_prodigal_faa(faa_path: str, target_seqid: str) -> Dict[str, Tuple[int, int, int, SeqRecord]]:
-    def extract_position_and_strand(record: SeqRecord):
-        description = record.description
+    # 只解析需要的 5 列，并直接读成目标类型
+    gff_df = pd.read_table(
+        gff_path, header=None, comment='#',
+        usecols=[0, 3, 4, 6, 8],
+        names=['genome', 'start', 'end', 'strand', 'description'],
+        dtype={'genome': 'string', 'start': 'int32', 'end': 'int32', 'strand': 'category', 'description': 'string'},
+    )
+    gff_df['seqid'] = gff_df['description'].str.extract(_LOCUS_TAG_RE)
+
+    target_seqids = set(target_seqids)
+    target_rows = gff_df[gff_df['seqid'].isin(target_seqids)]
+    genome_of = dict(zip(target_rows['seqid'], target_rows['genome']))
+    gff_df = gff_df[gff_df['genome'].isin(set(genome_of.values()))]
+    # 循环外一次建好 seqid -> (genome, start, end, strand) 字典（无 locus_tag 的行不入表），循环内 O(1) 查找；同一 seqid 多行时取第一行
+    gff_df = gff_df.dropna(subset=['seqid']).drop_duplicates('seqid', keep='first')
+    lookup = dict(zip(gff_df['seqid'], zip(gff_df['genome'], gff_df['start'].astype(int),
+                                           gff_df['end'].astype(int), gff_df['strand'])))
+
+    by_genome: Dict[str, SegInfo] = {g: {} for g in genome_of.values()}
+    for record in _iter_seqrecords(faa_path, byte_range):
+        rec_id = record.id
+        hit = lookup.get(rec_id)
+        if hit is not None:
+            genome, start, end, strand_str = hit
+            strand = 1 if str(strand_str) == '+' else -1
+            by_genome[genome][rec_id] = (int(start), int(end), strand, record)
+    tables = _target_tables(by_genome, genome_of)
+    return {sid: tables.get(sid, EMPTY_SEG_TABLE) for sid in target_seqids}
+
+
+def process_prodigal_faa(faa_path: str, target_seqids: Iterable[str], assume_contiguous: bool = False,
+                         byte_range: Tuple[int, int] | None = None) -> Dict[str, SegTable | str]:
+    def extract_position_and_strand(record: Record):
+        description = record.desc
         parts = description.split('#')
         if len(parts) < 4:
             raise ValueError(f"Description format error: {description}")
         start, end, strand = map(int, parts[1:4])
         return start, end, strand, record
 
-    target_genome = '_'.join(target_seqid.split('_')[:-1])
-    fasta_info: Dict[str, Tuple[int, int, int, SeqRecord]] = {}
+    genome_of = {sid: _prodigal_genome(sid) for sid in target_seqids}
+    by_genome: Dict[str, SegInfo] = {g: {} for g in genome_of.values()}
 
-    for record in _iter_seqrecords(faa_path):
-        rec_id = str(record.id)
-        genome = '_'.join(rec_id.split('_')[:-1])
-        if genome == target_genome:
-            fasta_info[rec_id] = extract_position_and_strand(record)
-    return fasta_info
+    # 只有目标 genome 的记录才会被构造并解析坐标
+    errors: Dict[str, str] = {}
+    for genome, record in _iter_genome_hits(_iter_fasta_lines(faa_path, byte_range), _prodigal_genome,
+                                            by_genome, assume_contiguous):
+        if genome in errors:
+            continue
+        try:
+            by_genome[genome][record.id] = extract_position_and_strand(record)
+        except Exception as e:
+            # 单条记录格式错误只让所在 genome 的 target 记为 ERROR，同一文件中的其它 genome 照常处理
+            errors[genome] = f"ERROR:{e}"
+    return _target_tables(by_genome, genome_of, errors)
 
 
-def process_translated_CDS_faa(faa_path: str, target_seqid: str) -> Dict[str, Tuple[int, int, int, SeqRecord]]:
+def process_translated_CDS_faa(faa_path: str, target_seqids: Iterable[str], assume_contiguous: bool = False,
+                               byte_range: Tuple[int, int] | None = None) -> Dict[str, SegTable | str]:
     def extract_numbers(input_str: str) -> List[int]:
-        numbers = re.findall(r'\d+', input_str)
+        numbers = _NUM_RE.findall(input_str)
         return list(map(int, numbers))
 
-    def extract_position_and_strand2(record: SeqRecord):
-        description = record.description
+    def extract_position_and_strand2(record: Record):
+        description = record.desc
         strand = -1 if 'complement' in description else 1
         parts = description.split('[location=')[-1].split(']')[0].split(',')[0]
         positions = extract_numbers(parts)
-        sorted_positions = np.sort(positions)
-        start = int(sorted_positions[0])
-        end = int(sorted_positions[-1])
+        # 只需首尾坐标，直接取 min/max，不必构造并排序 numpy 数组
+        start = min(positions)
+        end = max(positions)
         return start, end, strand, record
 
-    target_genome = target_seqid.replace('lcl|', '').split('_prot_')[0]
-    fasta_info: Dict[str, Tuple[int, int, int, SeqRecord]] = {}
-
-    for record in _iter_seqrecords(faa_path):
-        genome = record.id.replace('lcl|', '').split('_prot_')[0]
-        if genome == target_genome:
-            fasta_info[str(record.id)] = extract_position_and_strand2(record)
-    return fasta_info
+    genome_of = {sid: _translated_cds_genome(sid) for sid in target_seqids}
+    by_genome: Dict[str, SegInfo] = {g: {} for g in genome_of.values()}
 
-
-def get_faa_seg_info(faa_file: str, target_seqid: str, source: str) -> Dict[str, Tuple[int, int, int, SeqRecord]]:
+    # 先按 id 判断 genome，只有目标 genome 的记录才会被构造并解析 location
+    errors: Dict[str, str] = {}
+    for genome, record in _iter_genome_hits(_iter_fasta_lines(faa_path, byte_range), _translated_cds_genome,
+                                            by_genome, assume_contiguous):
+        if genome in errors:
+            continue
+        try:
+            by_genome[genome][record.id] = extract_position_and_strand2(record)
+        except Exception as e:
+            # 例如 location 中没有数字（min([]) 报错）：只影响该 genome
+            errors[genome] = f"ERROR:{e}"
+    return _target_tables(by_genome, genome_of, errors)
+
+
+def get_faa_seg_info(faa_file: str, target_seqids: Iterable[str], source: str,
+                     assume_contiguous: bool = False,
+                     byte_range: Tuple[int, int] | None = None) -> Dict[str, SegTable | str]:
+    """一次解析 faa_file，返回每个 target_seqid 所在 genome 的片段信息（该 genome 有记录解析失败时为 'ERROR:...'）。
+    assume_contiguous=True 时假定同一 genome 的记录在 FAA 中连续排列，读完全部目标 genome 即停止扫描；
+    byte_range 不为 None 时只解析该字节区间（见 _iter_seqrecords）"""
     if 'IMGM_metagenome(no more use)' in source:
-        return process_gff_faa(faa_file, target_seqid)
+        return process_gff_faa(faa_file, target_seqids, byte_range)
     elif 'translated_cds' in faa_file and 'NCBI' in source:
-        return process_translated_CDS_faa(faa_file, target_seqid)
+        return process_translated_CDS_faa(faa_file, target_seqids, assume_contiguous, byte_range)
     else:
-        return process_prodigal_faa(faa_file, target_seqid)
+        return process_prodigal_faa(faa_file, target_seqids, assume_contiguous, byte_range)
+
+
+def _merge_seg_tables(parts: List[Dict[str, SegTable | str]]) -> Dict[str, SegTable | str]:
+    """按字节区间顺序拼接各段的 SegTable（保持 FAA 中的记录顺序）；同一 genome 的 target 仍共享同一张表。
+    任一区间里该 genome 解析失败时，结果沿用该 'ERROR:...'"""
+    merged: Dict[str, SegTable | str] = {}
+    by_key: Dict[Tuple[int, ...], SegTable] = {}
+    for sid in parts[0]:
+        tables = [part[sid] for part in parts]
+        errors = [t for t in tables if isinstance(t, str)]
+        if errors:
+            merged[sid] = errors[0]
+            continue
+        key = tuple(id(t) for t in tables)
+        if key not in by_key:
+            by_key[key] = SegTable(
+                ids=[i for t in tables for i in t.ids],
+                starts=np.concatenate([t.starts for t in tables]),
+                ends=np.concatenate([t.ends for t in tables]),
+                strands=np.concatenate([t.strands for t in tables]),
+                records=[r for t in tables for r in t.records],
+            )
+        merged[sid] = by_key[key]
+    return merged
 
 
 # ------------------------------
@@ -151,98 +357,188 @@ def get_faa_seg_info(faa_file: str, target_seqid: str, source: str) -> Dict[str,
 # ------------------------------
 
 def extract_flanking_segments(
-    faa_seg_info: Dict[str, Tuple[int, int, int, SeqRecord]],
+    faa_seg_info: SegTable,
     target_name: str,
     target_start: int,
     target_end: int,
     upstream: int = 10000,
     downstream: int = 10000,
 ):
-    flanking_segments: List[SeqRecord] = []
+    flanking_segments: List[Record] = []
     flanking_segments_info: List[Tuple[str, int, int, int]] = []
 
     upstream_start = target_start - upstream
     downstream_end = target_end + downstream
 
-    for record_id, segment in faa_seg_info.items():
-        segment_start, segment_end, segment_strand, record = segment
-        if (segment_end >= upstream_start and segment_start <= downstream_end):
-            flanking_segments_info.append((record.id, int(segment_start), int(segment_end), int(segment_strand)))
-            flanking_segments.append(record)
+    # 向量化区间重叠筛选，再按命中位置取回 id / record
+    idxs = np.flatnonzero((faa_seg_info.ends >= upstream_start) & (faa_seg_info.starts <= downstream_end))
+    for i in idxs:
+        flanking_segments_info.append((faa_seg_info.ids[i], int(faa_seg_info.starts[i]),
+                                       int(faa_seg_info.ends[i]), int(faa_seg_info.strands[i])))
+        flanking_segments.append(faa_seg_info.records[i])
     return flanking_segments_info, flanking_segments
 
 
-def write_flanking_segments_to_fasta(flanking_segments: List[SeqRecord], output_fasta: str):
-    if not flanking_segments:
-        # 没有邻近片段也要产生一个空文件以便后续检查（可选）
-        open(output_fasta, 'w').close()
-        return
-    with open(output_fasta, 'w') as fasta_file:
-        for record in flanking_segments:
-            fasta_record = SeqRecord(record.seq, id=record.id, description=record.description)
-            SeqIO.write(fasta_record, fasta_file, 'fasta')
+def write_flanking_segments_to_fasta(flanking_segments: List[Record], output_fasta: str):
+    # 拼成一个字节串后一次 write；没有邻近片段时也会产生一个空文件以便后续检查
+    buf = ''.join(f">{r.id} {r.desc}\n{r.seq}\n" if r.desc else f">{r.id}\n{r.seq}\n" for r in flanking_segments)
+    with open(output_fasta, 'wb') as fasta_file:
+        fasta_file.write(buf.encode())
 
 
 # ------------------------------
-# Row processing (for parallel)
+# Group processing (for parallel)
 # ------------------------------
 
-def _process_single_row(index: int, row: pd.Series, faa_roots: Dict[str, str], upstream: int, downstream: int,
-                         overwrite: bool, out_dir: str):
-    # domtblout 基名 -> 原始 FASTA 基名
-    fasta_base = str(row['target_file']).split('.domtblout')[0]
-    source = str(row['source'])
-    root_faa_dir = faa_roots.get(source)
-    if root_faa_dir is None:
-        return index, '[]', []  # unknown source -> skip
+# 每个 worker 进程只在启动时接收一次的共享参数（由 Pool initializer 设置），任务本身只携带行数据
+_WORKER_ARGS: Dict = {}
+
+# 未压缩 FAA 超过该大小且 workers > 1 时，按字节区间切分后由进程池并行扫描（单个大文件也能用满所有核）
+PARALLEL_SCAN_MIN_BYTES = 200 * 1024 * 1024
 
-    faa_file = _resolve_faa_path(root_faa_dir, fasta_base)
-    if faa_file is None:
-        return index, '[]', []  # missing fasta -> skip
 
-    id_ = row['target_name']
-    target_start = int(min(row['prot_start'], row['prot_end']))
-    target_end = int(max(row['prot_start'], row['prot_end']))
+def _init_worker(upstream: int, downstream: int, overwrite: bool, out_dir: str, assume_contiguous: bool):
+    _WORKER_ARGS.update(upstream=upstream, downstream=downstream,
+                        overwrite=overwrite, out_dir=out_dir, assume_contiguous=assume_contiguous)
 
+
+def _process_group_task(task: Tuple[str | None, str, List[Tuple[int, Dict]]]) -> List[Tuple[int, str]]:
+    faa_file, source, items = task
+    return _process_group(items, faa_file, source, **_WORKER_ARGS)
+
+
+def _scan_range_task(task) -> Tuple[int, int, Dict[str, SegTable | str] | str]:
+    """大文件的单个字节区间：返回 (group 序号, 区间序号, 该区间的 SegTable 或 'ERROR:...')"""
+    gi, k, faa_file, source, target_seqids, byte_range = task
     try:
-        faa_seg_info = get_faa_seg_info(faa_file, id_, source)
-        flanking_segments_info, flanking_segments = extract_flanking_segments(
-            faa_seg_info, id_, target_start, target_end, upstream=upstream, downstream=downstream
-        )
+        return gi, k, get_faa_seg_info(faa_file, target_seqids, source,
+                                       _WORKER_ARGS['assume_contiguous'], byte_range)
     except Exception as e:
-        # 返回空并在主进程里打印
-        return index, f"ERROR:{e}", []
+        return gi, k, f"ERROR:{e}"
 
-    # 写 FASTA（每个 target_name 一份）
-    out_fa = os.path.join(out_dir, f"{id_}_flanking.fasta")
-    if overwrite or (not os.path.exists(out_fa)):
-        os.makedirs(out_dir, exist_ok=True)
-        write_flanking_segments_to_fasta(flanking_segments, out_fa)
 
-    return index, json.dumps(flanking_segments_info), []  # sequences 已写文件，这里不回传
+def _process_group(items: List[Tuple[int, Dict]], faa_file: str | None, source: str, upstream: int, downstream: int,
+                   overwrite: bool, out_dir: str, assume_contiguous: bool = False) -> List[Tuple[int, str]]:
+    """items 为同一 (source, target_file) 的所有行 [(index, row_dict), ...]；FAA 只解析一次。
+    faa_file 已在主进程中解析好（None 表示未知 source 或缺失 FASTA）。
+    返回 [(index, info_json 或 'ERROR:...'), ...]"""
+    if faa_file is None:
+        return [(index, '[]') for index, _ in items]  # unknown source / missing fasta -> skip
+
+    try:
+        # 每个 (source, target_file) 组只分派一次，直接解析，不做跨组缓存
+        target_seqids = {row['target_name'] for _, row in items}
+        seg_info_by_target = get_faa_seg_info(faa_file, target_seqids, source, assume_contiguous)
+    except Exception as e:
+        # 返回错误并在主进程里打印
+        return [(index, f"ERROR:{e}") for index, _ in items]
+
+    return _emit_group(items, seg_info_by_target, upstream, downstream, overwrite, out_dir)
+
+
+def _emit_group(items: List[Tuple[int, Dict]], seg_info_by_target: Dict[str, SegTable | str], upstream: int,
+                downstream: int, overwrite: bool, out_dir: str) -> List[Tuple[int, str]]:
+    """对已解析好的 FAA 逐行提取侧翼片段并写 FASTA"""
+    results: List[Tuple[int, str]] = []
+    for index, row in items:
+        id_ = row['target_name']
+        seg_table = seg_info_by_target.get(id_, EMPTY_SEG_TABLE)
+        if isinstance(seg_table, str):
+            results.append((index, seg_table))  # 所在 genome 解析失败
+            continue
+        try:
+            target_start = int(min(row['prot_start'], row['prot_end']))
+            target_end = int(max(row['prot_start'], row['prot_end']))
+            flanking_segments_info, flanking_segments = extract_flanking_segments(
+                seg_table, id_, target_start, target_end, upstream=upstream, downstream=downstream
+            )
+        except Exception as e:
+            results.append((index, f"ERROR:{e}"))
+            continue
+
+        # 写 FASTA（每个 target_name 一份）
+        out_fa = os.path.join(out_dir, f"{id_}_flanking.fasta")
+        if overwrite or (not os.path.exists(out_fa)):
+            os.makedirs(out_dir, exist_ok=True)
+            write_flanking_segments_to_fasta(flanking_segments, out_fa)
+
+        results.append((index, json.dumps(flanking_segments_info)))  # sequences 已写文件，这里不回传
+    return results
 
 
 def process_dataframe_parallel(df: pd.DataFrame, out_dir: str, faa_roots: Dict[str, str],
-                               workers: int, upstream: int, downstream: int, overwrite: bool) -> pd.DataFrame:
+                               workers: int, upstream: int, downstream: int, overwrite: bool,
+                               assume_contiguous: bool = False) -> pd.DataFrame:
     df = df.copy()
-    df['flanking_segments'] = ''
-
-    futures = []
-    with ProcessPoolExecutor(max_workers=workers) as executor:
-        for index, row in df.iterrows():
-            futures.append(
-                executor.submit(_process_single_row, index, row, faa_roots, upstream, downstream, overwrite, out_dir)
-            )
-        for i, fut in enumerate(as_completed(futures), 1):
-            index, info_json, _ = fut.result()
+    # 结果先按位置写入预分配数组，最后一次性赋值，避免逐行 df.loc 写入
+    flanking = np.full(len(df), '', dtype=object)
+    pos = {idx: i for i, idx in enumerate(df.index)}
+
+    # 每个用到的 source 目录只 listdir 一次，FAA 路径在主进程里查表解析，不再逐个 stat 候选文件
+    used_sources = set(df['source'].astype(str))
+    faa_index = {src: _build_faa_index(root) for src, root in faa_roots.items() if src in used_sources}
+
+    # 按 (source, target_file) 分组派发：同一 FAA 的多个 target 只解析一次
+    groups = []
+    for (source, target_file), sub in df.groupby(['source', 'target_file'], sort=False, dropna=False):
+        source = str(source)
+        # domtblout 基名 -> 原始 FASTA 基名
+        fasta_base = str(target_file).split('.domtblout')[0]
+        faa_file = _resolve_faa_path(faa_index[source], fasta_base) if source in faa_index else None
+        groups.append((faa_file, source, list(zip(sub.index, sub.to_dict('records')))))
+
+    workers = max(1, workers)
+    # 大的未压缩 FAA 单独拿出来，按字节区间拆成 workers 个扫描任务
+    scan_tasks = []
+    big_groups = {}
+    if workers > 1:
+        for gi, (faa_file, source, items) in enumerate(groups):
+            if faa_file is None or faa_file.endswith('.gz') or os.path.getsize(faa_file) < PARALLEL_SCAN_MIN_BYTES:
+                continue
+            try:
+                target_seqids = tuple(sorted({row['target_name'] for _, row in items}))
+            except TypeError:
+                continue  # target_name 含缺失值，交给常规路径报错
+            ranges = _byte_ranges(faa_file, workers)
+            big_groups[gi] = [None] * len(ranges)
+            scan_tasks.extend((gi, k, faa_file, source, target_seqids, r) for k, r in enumerate(ranges))
+    small_groups = [g for gi, g in enumerate(groups) if gi not in big_groups]
+
+    done = 0
+
+    def _collect(group_results: List[Tuple[int, str]]):
+        nonlocal done
+        for index, info_json in group_results:
             if info_json.startswith('ERROR:'):
                 print(f"[WARN] index={index} {info_json}")
-                df.loc[index, 'flanking_segments'] = '[]'
+                flanking[pos[index]] = '[]'
             else:
-                df.loc[index, 'flanking_segments'] = info_json
-            if i % 100 == 0:
-                print(f"… processed {i}/{len(futures)} rows")
-
+                flanking[pos[index]] = info_json
+            done += 1
+            if done % 100 == 0:
+                print(f"… processed {done}/{len(df)} rows")
+
+    with Pool(workers, initializer=_init_worker,
+              initargs=(upstream, downstream, overwrite, out_dir, assume_contiguous)) as pool:
+        if scan_tasks:
+            print(f"[INFO] parallel byte-range scan: {len(big_groups)} large FAA(s), {len(scan_tasks)} chunks")
+            for gi, k, part in pool.imap_unordered(_scan_range_task, scan_tasks):
+                big_groups[gi][k] = part
+            # 合并各区间结果后在主进程中提取 / 写出
+            for gi, parts in big_groups.items():
+                items = groups[gi][2]
+                errors = [p for p in parts if isinstance(p, str)]
+                if errors:
+                    _collect([(index, errors[0]) for index, _ in items])
+                    continue
+                _collect(_emit_group(items, _merge_seg_tables(parts), upstream, downstream, overwrite, out_dir))
+
+        # imap_unordered + chunksize：worker 从共享队列批量取任务，减少逐个 submit/pickle 的开销
+        chunksize = max(1, len(small_groups) // (workers * 8))
+        for group_results in pool.imap_unordered(_process_group_task, small_groups, chunksize=chunksize):
+            _collect(group_results)
+
+    df['flanking_segments'] = flanking
     return df
 
 
@@ -311,6 +607,8 @@ def main():
     p.add_argument('--upstream', type=int, default=10000, help='上游窗口大小(bp)')
     p.add_argument('--downstream', type=int, default=10000, help='下游窗口大小(bp)')
     p.add_argument('--overwrite', action='store_true', help='覆盖已存在的 <target_name>_flanking.fasta')
+    p.add_argument('--assume-contiguous-genomes', action='store_true',
+                   help='假定 FAA 中同一 genome/contig 的蛋白连续排列（prodigal 默认输出），读完目标 genome 即停止扫描')
     args = p.parse_args()
 
     # Load table
@@ -340,6 +638,7 @@ def main():
         upstream=args.upstream,
         downstream=args.downstream,
         overwrite=args.overwrite,
+        assume_contiguous=args.assume_contiguous_genomes,
     )
 
     # Save DF
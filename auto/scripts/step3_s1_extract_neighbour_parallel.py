@@ -1,10 +1,12 @@
 import os
 import pandas as pd
 from Bio import SeqIO
-from Bio.SeqRecord import SeqRecord
 import re
-import numpy as np
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import Pool
+
+# 模块级预编译的正则，避免逐条记录重复编译 / 查缓存
+_LOCUS_TAG_RE = re.compile(r"locus_tag=([^;]+)")
+_NUM_RE = re.compile(r'\d+')
 
 
 def get_faa_seg_info(faa_file, target_seqid, source):
@@ -23,22 +25,28 @@ def process_gff_faa(faa_path, target_seqid):
         print(f"Skipping {gff_path}, file does not exist.")
         return {}  # Return an empty dictionary if GFF file does not exist
 
-    gff_df = pd.read_table(gff_path, header=None, comment='#')
-    gff_df = gff_df.iloc[:, [0, 3, 4, 6, 8]]
-    gff_df.columns = ['genome', 'start', 'end', 'strand', 'description']
-    pattern = r"locus_tag=([^;]+)"
-    gff_df['seqid'] = gff_df['description'].str.extract(pattern)
+    # 只解析需要的 5 列，并直接读成目标类型
+    gff_df = pd.read_table(
+        gff_path, header=None, comment='#',
+        usecols=[0, 3, 4, 6, 8],
+        names=['genome', 'start', 'end', 'strand', 'description'],
+        dtype={'genome': 'string', 'start': 'int32', 'end': 'int32', 'strand': 'category', 'description': 'string'},
+    )
+    gff_df['seqid'] = gff_df['description'].str.extract(_LOCUS_TAG_RE)
 
     target_genome = gff_df[gff_df['seqid'] == target_seqid]['genome'].unique()
     gff_df = gff_df[gff_df['genome'].isin(target_genome)]
 
+    # 循环外一次建好 seqid -> (start, end, strand) 字典（无 locus_tag 的行不入表），循环内 O(1) 查找；同一 seqid 多行时取第一行
+    gff_df = gff_df.dropna(subset=['seqid']).drop_duplicates('seqid', keep='first')
+    lookup = dict(zip(gff_df['seqid'], zip(gff_df['start'].values, gff_df['end'].values, gff_df['strand'].values)))
+
     fasta_info = {}
     for record in SeqIO.parse(faa_path, "fasta"):
         rec_id = str(record.id)
-        if rec_id in gff_df['seqid'].values:
-            fasta_info[rec_id] = gff_df[gff_df['seqid'] == rec_id]['start'].values[0], \
-            gff_df[gff_df['seqid'] == rec_id]['end'].values[0], \
-                gff_df[gff_df['seqid'] == rec_id]['strand'].values[0], record
+        hit = lookup.get(rec_id)
+        if hit is not None:
+            fasta_info[rec_id] = hit + (record,)
     return fasta_info
 
 
@@ -53,10 +61,10 @@ def process_prodigal_faa(faa_path, target_seqid):
 
     def get_fasta_info(fasta_file, target_seqid):
         fasta_info = {}
-        target_genome = '_'.join(target_seqid.split('_')[:-1])
+        target_genome = target_seqid.rpartition('_')[0]
         for record in SeqIO.parse(fasta_file, "fasta"):
             rec_id = str(record.id)
-            genome = '_'.join(rec_id.split('_')[:-1])  # 假设genome信息在ID的第一个部分
+            genome = rec_id.rpartition('_')[0]  # 假设genome信息在ID的第一个部分
 
             if genome == target_genome:
                 fasta_info[rec_id] = extract_position_and_strand(record)
@@ -71,7 +79,7 @@ def process_translated_CDS_faa(faa_path, target_seqid):
         """
         提取字符串中的所有数字
         """
-        numbers = re.findall(r'\d+', input_str)
+        numbers = _NUM_RE.findall(input_str)
         return list(map(int, numbers))
 
     def extract_position_and_strand2(record):
@@ -83,9 +91,8 @@ def process_translated_CDS_faa(faa_path, target_seqid):
         parts = description.split('[location=')[-1].split(']')[0].split(',')[0]
         positions = extract_numbers(parts)
 
-        sorted_positions = np.sort(positions)  # 对数字进行排序
-        start = int(sorted_positions[0])
-        end = int(sorted_positions[-1])
+        start = min(positions)  # 只需首尾坐标，直接取 min/max
+        end = max(positions)
 
         return start, end, strand, record
 
@@ -126,12 +133,11 @@ def extract_flanking_segments(faa_seg_info, target_name, target_start, target_en
 
 # 提取片段的FASTA序列并写入到新的FASTA文件
 def write_flanking_segments_to_fasta(flanking_segments, output_fasta):
-    # 创建新的FASTA文件
-    with open(output_fasta, 'w') as fasta_file:
-        for record in flanking_segments:
-            # 创建一个新的 SeqRecord 对象，并写入文件
-            fasta_record = SeqRecord(record.seq, id=record.id, description=record.description)
-            SeqIO.write(fasta_record, fasta_file, "fasta")
+    # 拼成一个字符串后一次写入（SeqIO.parse 得到的 description 已以 id 开头）
+    # Biopython 1.78 的 Seq 没有 __bytes__，用 str(record.seq) 拼好文本后统一 encode 一次
+    buf = ''.join(f">{record.description}\n{record.seq}\n" for record in flanking_segments)
+    with open(output_fasta, 'wb') as fasta_file:
+        fasta_file.write(buf.encode())
 
 
 # 读取DataFrame并处理
@@ -156,17 +162,28 @@ def process_single_row(index, row, faa_dict):
     return index, flanking_segments_info, flanking_segments
 
 
+# faa_dict 通过 Pool initializer 在每个 worker 中只传一次
+_FAA_DICT = {}
+
+
+def _init_worker(faa_dict):
+    _FAA_DICT.update(faa_dict)
+
+
+def _process_single_row_task(task):
+    index, row = task
+    return process_single_row(index, row, _FAA_DICT)
+
+
 def process_dataframe_parallel(df, out_dir, faa_dict):
     all_flanking_segments = {}
-    futures = []
-
-    with ProcessPoolExecutor() as executor:
-        for index, row in df.iterrows():
-            future = executor.submit(process_single_row, index, row, faa_dict)
-            futures.append(future)
+    tasks = [(index, row) for index, row in zip(df.index, df.to_dict('records'))]
+    workers = os.cpu_count() or 1
+    chunksize = max(1, len(tasks) // (workers * 8))
 
-        for future in as_completed(futures):
-            index, flanking_segments_info, flanking_segments = future.result()
+    with Pool(workers, initializer=_init_worker, initargs=(faa_dict,)) as pool:
+        for index, flanking_segments_info, flanking_segments in pool.imap_unordered(
+                _process_single_row_task, tasks, chunksize=chunksize):
 
             # 将片段信息记录到新列
             df.loc[index, 'flanking_segments'] = str(flanking_segments_info)
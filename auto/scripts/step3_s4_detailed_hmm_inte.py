@@ -23,13 +23,21 @@ python step3_s2_detailed_hmm_inte_cli.py \
 
 """
 from __future__ import annotations
+import io
 import os
+import csv
 import gzip
 import argparse
 from pathlib import Path
 import pandas as pd
 from concurrent.futures import ProcessPoolExecutor, as_completed
-from typing import Iterable, List
+from typing import Iterable
+
+try:
+    # 可选依赖：ISA-L 加速的多线程 gzip 解压；未安装时回退到标准库 gzip
+    from isal import igzip_threaded  # type: ignore
+except ImportError:
+    igzip_threaded = None
 
 # HMMER domtblout 标准字段列表（22 + description）
 COLNAMES = [
@@ -43,50 +51,81 @@ COLNAMES = [
 ]
 
 
-def _open_text(path: Path):
+def _open_text(path: str):
     """Open text file, supporting optional .gz."""
-    if str(path).endswith('.gz'):
+    if path.endswith('.gz'):
+        if igzip_threaded is not None:
+            return igzip_threaded.open(path, 'rt', threads=2, block_size=2 * 1024 * 1024)
         return gzip.open(path, 'rt')
     return open(path, 'r')
 
 
-def parse_domtblout(domtblout_path: Path) -> pd.DataFrame | None:
+def parse_domtblout(domtblout_path: str, target_file: str) -> bytes | None:
+    """解析单个 domtblout，直接返回带 target_file 列、无表头的 TSV 字节串，
+    避免跨进程 pickle 整个 DataFrame"""
     try:
+        # 只解压/读盘一次，同一份文本分别交给 C 引擎与 description 提取
         with _open_text(domtblout_path) as f:
-            lines = [line.strip() for line in f if not line.startswith('#') and line.strip()]
-        if not lines:
+            text = f.read()
+
+        # 22 个固定列交给 pandas C 引擎解析；全部按字符串读入，保持原样输出
+        df = pd.read_csv(
+            io.StringIO(text),
+            sep=r'\s+',
+            comment='#',
+            header=None,
+            names=COLNAMES[:22],
+            usecols=range(22),
+            dtype=str,
+            na_filter=False,
+            quoting=csv.QUOTE_NONE,
+            engine='c'
+        )
+        if df.empty:
             return None
 
-        records: List[List[str]] = []
-        for line in lines:
-            parts = line.split()
-            if len(parts) < 22:
+        # description（prodigal 的 '# start # end # strand #' 也在其中）会被 comment='#' 截断，
+        # 因此用 maxsplit 单独取第 23 段
+        descriptions = []
+        for line in text.splitlines():
+            if line.startswith('#') or not line.strip():
                 continue
-            fixed = parts[:22]
-            description = ' '.join(parts[22:])
-            fixed.append(description)
-            records.append(fixed)
-
-        if not records:
+            parts = line.split(None, 22)
+            descriptions.append(' '.join(parts[22].split()) if len(parts) > 22 else '')
+        if len(descriptions) != len(df):
+            raise ValueError(f"description 行数({len(descriptions)})与表格行数({len(df)})不一致")
+        df['description'] = descriptions
+
+        # 不足 22 列的行直接丢弃
+        df = df[df['acc'] != '']
+        if df.empty:
             return None
-
-        df = pd.DataFrame(records, columns=COLNAMES)
-        return df
+        df['target_file'] = target_file
+        return df.to_csv(sep='\t', header=False, index=False).encode()
+    except pd.errors.EmptyDataError:
+        return None
     except Exception as e:
         print(f"❌ Error reading {domtblout_path}: {e}")
         return None
 
 
-def _iter_domtblout_files(root: Path, recursive: bool, ext: str, include_gz: bool) -> Iterable[Path]:
-    patterns = [f"*{ext}"]
-    if include_gz:
-        patterns.append(f"*{ext}.gz")
-    if recursive:
-        for pat in patterns:
-            yield from root.rglob(pat)
-    else:
-        for pat in patterns:
-            yield from root.glob(pat)
+def _iter_domtblout_files(root: str, recursive: bool, ext: str, include_gz: bool) -> Iterable[str]:
+    """os.scandir 迭代遍历（显式栈）一次完成，后缀判断内联，直接产出字符串路径，
+    不再为 .domtblout / .domtblout.gz 各做一遍 rglob"""
+    suffixes = (ext, ext + '.gz') if include_gz else (ext,)
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            stack.append(entry.path)
+                    elif entry.name.endswith(suffixes):
+                        yield entry.path
+        except OSError as e:
+            print(f"⚠️ Cannot scan {current}: {e}")
 
 
 def main():
@@ -104,39 +143,43 @@ def main():
     out_path = Path(args.output).resolve()
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
-    domtblout_files = list(_iter_domtblout_files(in_root, args.recursive, args.ext, args.include_gz))
+    domtblout_files = list(_iter_domtblout_files(str(in_root), args.recursive, args.ext, args.include_gz))
     if not domtblout_files:
         print(f"⚠️ No *{args.ext}[.gz] files found under: {in_root}")
         return
+    # 大文件优先提交，避免末尾少数大文件拖住单个 worker、其余 worker 空等
+    domtblout_files.sort(key=os.path.getsize, reverse=True)
 
     print(f"🔎 Found {len(domtblout_files)} files. Parsing with workers={args.workers} …")
-    merged_df_list: List[pd.DataFrame] = []
-    with ProcessPoolExecutor(max_workers=args.workers) as executor:
-        futures = {executor.submit(parse_domtblout, p): p for p in domtblout_files}
-        for fut in as_completed(futures):
-            p = futures[fut]
-            df = fut.result()
-            if df is None:
-                continue
-            # 附加 target_file 列
-            df = df.copy()
-            if args.relative_path:
-                df['target_file'] = str(p.relative_to(in_root))
-            else:
-                df['target_file'] = p.name
-            merged_df_list.append(df)
-
-    if not merged_df_list:
-        print("⚠️ No valid records to write.")
-        return
-
-    merged = pd.concat(merged_df_list, ignore_index=True)
     # 输出单个 TSV（避免原脚本中的双 .tsv）
     if not out_path.suffix:
         out_path = out_path.with_suffix('.tsv')
-    merged.to_csv(out_path, sep='\t', index=False)
-    print(f"✅ Written to: {out_path}")
 
+    # 结果到达即追加写入同一个 TSV（主进程单写者），不再整体 concat；首个有效结果时才创建文件
+    out_fh = None
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            # target_file 列：文件名或相对路径
+            futures = [
+                executor.submit(parse_domtblout, p, os.path.relpath(p, in_root) if args.relative_path else os.path.basename(p))
+                for p in domtblout_files
+            ]
+            for fut in as_completed(futures):
+                data = fut.result()
+                if data is None:
+                    continue
+                if out_fh is None:
+                    out_fh = open(out_path, 'wb')
+                    out_fh.write(('\t'.join(COLNAMES + ['target_file']) + '\n').encode())
+                out_fh.write(data)
+    finally:
+        if out_fh is not None:
+            out_fh.close()
+
+    if out_fh is None:
+        print("⚠️ No valid records to write.")
+        return
+    print(f"✅ Written to: {out_path}")
 
 if __name__ == '__main__':
     main()
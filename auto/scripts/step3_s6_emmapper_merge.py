@@ -3,7 +3,7 @@
 """
 Step3 S6 — Merge eggNOG-mapper results (CLI)
 
-把一个目录下的 *.emapper.annotations 与 *.seed_orthologs 合并为单一 TSV。
+把一个目录下的 *.emapper.annotations 与 *.seed_orthologs 合并为单一 TSV（或 --format parquet）。
 - 支持递归、可选并行读取、可选 .gz（按扩展名自动判断）。
 - annotations 与 seed_orthologs 均按 query_name 合并（left join）。
 
@@ -15,12 +15,21 @@ Step3 S6 — Merge eggNOG-mapper results (CLI)
 """
 from __future__ import annotations
 import os
+import io
+import gzip
 import argparse
 from pathlib import Path
 from typing import List, Optional
 import pandas as pd
 from concurrent.futures import ProcessPoolExecutor, as_completed
 
+# 可选：pyarrow 多线程 C++ CSV 解析器（未安装时回退到 pandas）
+try:
+    import pyarrow as pa  # type: ignore
+    from pyarrow import csv as pacsv  # type: ignore
+except ImportError:
+    pa = pacsv = None
+
 # ========== 期望列定义（与现有脚本保持一致） ==========
 ANN_COLUMNS = [
     'query_name','seed_ortholog','evalue','score','eggNOG_OGs','max_annot_lvl','COG_category',
@@ -31,8 +40,35 @@ ORTH_COLUMNS = ['query_name','sseqid','evalue_orth','bitscore','qstart','qend','
 
 # ========== 读文件工具 ==========
 
+def _read_table_arrow(path: Path) -> Optional[pd.DataFrame]:
+    """pyarrow 版本：先整行丢弃 # 注释行（Arrow 不支持 comment），列数取首个数据行，
+    所有列按字符串读入，列名与 header=None 时一致（0..n-1）"""
+    opener = gzip.open if path.suffix == '.gz' else open
+    with opener(path, 'rb') as f:
+        data = b''.join(line for line in f if not line.startswith(b'#') and line.strip())
+    if not data:
+        return None
+    end = data.find(b'\n')
+    n_cols = (data if end < 0 else data[:end]).count(b'\t') + 1
+    names = [f'c{i}' for i in range(n_cols)]
+    table = pacsv.read_csv(
+        io.BytesIO(data),
+        read_options=pacsv.ReadOptions(column_names=names, use_threads=True),
+        parse_options=pacsv.ParseOptions(delimiter='\t'),
+        convert_options=pacsv.ConvertOptions(column_types={c: pa.string() for c in names}, strings_can_be_null=True),
+    )
+    df = table.to_pandas()
+    df.columns = range(n_cols)
+    return df
+
+
 def _read_table_nohdr(path: Path) -> Optional[pd.DataFrame]:
     """读取去注释（#）的制表文件，无表头。空表返回 None。支持 .gz 由 pandas 自动处理。"""
+    if pacsv is not None:
+        try:
+            return _read_table_arrow(path)
+        except Exception as e:
+            print(f"[WARN] pyarrow 读取失败，回退 pandas: {path} -> {e}")
     try:
         df = pd.read_csv(path, sep='\t', comment='#', header=None, dtype=str)
         if df.empty:
@@ -62,9 +98,10 @@ def _batch_read(paths: List[Path], expected_cols: int, workers: int) -> List[pd.
             if df.shape[1] < expected_cols:
                 print(f"[WARN] 列数({df.shape[1]})少于期望({expected_cols}): {p} -> 跳过")
                 continue
-            out.append(df.iloc[:, :expected_cols].copy())
+            out.append(df.iloc[:, :expected_cols])
         return out
 
+    # 去注释行的 Python 过滤与 to_pandas 都持有 GIL，线程无法并行，因此始终用进程池
     with ProcessPoolExecutor(max_workers=workers) as ex:
         futs = {ex.submit(_read_table_nohdr, p): p for p in paths}
         for fut in as_completed(futs):
@@ -75,9 +112,36 @@ def _batch_read(paths: List[Path], expected_cols: int, workers: int) -> List[pd.
             if df.shape[1] < expected_cols:
                 print(f"[WARN] 列数({df.shape[1]})少于期望({expected_cols}): {p} -> 跳过")
                 continue
-            out.append(df.iloc[:, :expected_cols].copy())
+            out.append(df.iloc[:, :expected_cols])
     return out
 
+# ========== 写出 ==========
+
+def _write_tsv(df: pd.DataFrame, out_path: Path) -> None:
+    """所有列均按字符串读入，Arrow 以 quoting_style='none' 写出与 to_csv 逐字节一致；
+    遇到需要加引号的值（制表符 / 引号 / 换行）Arrow 会报错，此时回退 pandas"""
+    if pacsv is not None:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            # Arrow 的表头总会加引号，表头自己写
+            with open(out_path, 'wb') as f:
+                f.write(('\t'.join(map(str, df.columns)) + '\n').encode())
+                pacsv.write_csv(table, f, write_options=pacsv.WriteOptions(
+                    include_header=False, delimiter='\t', quoting_style='none'))
+            return
+        except Exception as e:
+            print(f"[WARN] pyarrow 写出失败，回退 pandas: {out_path} -> {e}")
+    df.to_csv(out_path, sep='\t', index=False)
+
+def _infer_numeric(df: pd.DataFrame) -> pd.DataFrame:
+    """Parquet 保留类型：把能整体解析为数值的列转成数值，与 s7 从 TSV 读回时 pandas 的推断一致"""
+    for c in df.columns:
+        try:
+            df[c] = pd.to_numeric(df[c])
+        except (ValueError, TypeError):
+            pass
+    return df
+
 # ========== 主流程 ==========
 
 def main():
@@ -86,7 +150,12 @@ def main():
     ap.add_argument('-o','--output', required=True, help='输出 TSV 路径')
     ap.add_argument('--recursive', action='store_true', help='递归搜索子目录')
     ap.add_argument('--workers', type=int, default=1, help='并行读取进程数（默认 1，建议 8~64）')
+    ap.add_argument('--format', choices=['tsv', 'parquet'], default='tsv',
+                    help='输出格式（默认 tsv；parquet 需 pyarrow，s7 可直接读取 .parquet）')
     args = ap.parse_args()
+    if args.format == 'parquet' and pa is None:
+        print('[ERR] --format parquet 需要安装 pyarrow')
+        return
 
     in_dir = Path(args.input).resolve()
     out_path = Path(args.output).resolve()
@@ -107,13 +176,13 @@ def main():
     if not ann_dfs:
         print('[ERR] 无有效 annotations 记录，退出。')
         return
-    ann_merged = pd.concat(ann_dfs, ignore_index=True)
+    ann_merged = pd.concat(ann_dfs, ignore_index=True, copy=False)
     ann_merged.columns = ANN_COLUMNS
 
     if orth_paths:
         orth_dfs = _batch_read(orth_paths, expected_cols=len(ORTH_COLUMNS), workers=args.workers)
         if orth_dfs:
-            orth_merged = pd.concat(orth_dfs, ignore_index=True)
+            orth_merged = pd.concat(orth_dfs, ignore_index=True, copy=False)
             orth_merged.columns = ORTH_COLUMNS
             final_df = pd.merge(ann_merged, orth_merged, on='query_name', how='left')
         else:
@@ -122,7 +191,11 @@ def main():
     else:
         final_df = ann_merged
 
-    final_df.to_csv(out_path, sep='\t', index=False)
+    if args.format == 'parquet':
+        _infer_numeric(final_df).to_parquet(out_path, engine='pyarrow', compression='zstd',
+                                            row_group_size=100_000, index=False)
+    else:
+        _write_tsv(final_df, out_path)
     print(f"[OK] 写出：{out_path}")
 
 
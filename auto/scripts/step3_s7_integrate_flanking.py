@@ -1,5 +1,6 @@
 import pandas as pd
-import ast
+
+from step3_s7_integrate_flanking_parallel import expand_step3_parallel, add_relative_distance
 
 # 读取 pfam 结果并重命名
 p_df = pd.read_table('/work/zhangrh/couple_procject/result/cas9/flanking/step3_merged_pfam.tsv')
@@ -22,44 +23,14 @@ em_df.rename(columns={
 
 # 读取主 df
 df = pd.read_table('/work/zhangrh/couple_procject/result/cas9/processed_df/step3_df.tsv')
-df['flanking_segments'] = df['flanking_segments'].apply(
-    lambda x: ast.literal_eval(x) if isinstance(x, str) else x
-)
 # 需要保留的原始列
 keep_cols = [
     'target_name', 'target_file', 'prot_start', 'prot_end',
     'cluster_100_repseq', 'source'
 ]
-# 拆分 flanking_segments
-rows = []
-for index, row in df.iterrows():
-    flanking_segments = row['flanking_segments']
-    for flanking_segments_item in flanking_segments:
-        flanking_id = flanking_segments_item[0]
-
-        if isinstance(flanking_segments_item, (list, tuple)) and len(flanking_segments_item) >= 4:
-            rows.append({
-                # 保留指定列
-                **{col: row[col] for col in keep_cols if col in row},
-                # 新拆分列
-                'flanking_id': flanking_segments_item[0],
-                'flanking_start': flanking_segments_item[1],
-                'flanking_end': flanking_segments_item[2],
-                'flanking_strand': flanking_segments_item[3]
-            })
-
-df_expanded = pd.DataFrame(rows)
-
-# 计算具体距离
-def calc_distance(row):
-    if row['flanking_end'] < row['prot_start']:  # 上游
-        return row['flanking_end'] - row['prot_start']
-    elif row['flanking_start'] > row['prot_end']:  # 下游
-        return row['flanking_start'] - row['prot_end']
-    else:  # 重叠
-        return 0
-
-df_expanded['relative_distance'] = df_expanded.apply(calc_distance, axis=1)
+# 展开 flanking_segments 与计算相对距离复用 step3_s7_integrate_flanking_parallel 中的实现（main.sh 使用的版本）
+df_expanded = expand_step3_parallel(df, [col for col in keep_cols if col in df.columns])
+df_expanded = add_relative_distance(df_expanded)
 df_expanded = pd.merge(
     df_expanded, em_df[['flanking_id', 'emapper_evalue', 'emapper_protein_start',
                         'emapper_protein_end', 'emapper_protein_cov']],
@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-Step3 S7 — Integrate flanking annotations (CLI, multi-processing accelerated)
+Step3 S7 — Integrate flanking annotations (CLI)
 
-在 s7 CLI 的基础上，加入 --workers 并行展开 flanking_segments（分块并行），
+在 s7 CLI 的基础上，用 explode 向量化展开 flanking_segments，
 随后与 PFAM / eggNOG 合并并写出。
 
 示例：
@@ -18,30 +18,75 @@ from __future__ import annotations
 import argparse
 import ast
 from pathlib import Path
-from typing import Iterable, List, Dict, Any
-from concurrent.futures import ProcessPoolExecutor, as_completed
-import math
+from typing import Iterable, List, Any, Optional
 
+import numpy as np
 import pandas as pd
 
+# 可选：pyarrow 多线程 C++ CSV 解析器（未安装时回退到 pandas）
+try:
+    import pyarrow as pa  # type: ignore
+    from pyarrow import csv as pacsv  # type: ignore
+except ImportError:
+    pa = None
+    pacsv = None
+
 
 # ------------------------------
 # I/O helpers
 # ------------------------------
 
-def _read_tsv(path: Path) -> pd.DataFrame:
+def _read_tsv(path: Path, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """读取 TSV 或 .parquet（s6 --format parquet 的输出）；给定 columns 时按列投影，只加载其中存在的列"""
     if not path.exists():
         raise FileNotFoundError(f"Not found: {path}")
+    if path.suffix == '.parquet':
+        import pyarrow.parquet as pq  # parquet 本身依赖 pyarrow
+        if columns is not None:
+            names = set(pq.read_schema(path).names)
+            columns = [c for c in columns if c in names]
+        return pd.read_parquet(path, columns=columns, engine='pyarrow')
+    # 只读表头确定实际存在的列，不需要的列（如 step3_df 的其它注释列）不做解析
+    names = list(pd.read_table(path, nrows=0).columns)
+    if columns is not None:
+        columns = [c for c in columns if c in names]
+    if pacsv is not None:
+        # Arrow 只负责多线程切分/解码，所有列按字符串读入；
+        # 数值转换交给 pd.to_numeric（与 pandas C 解析器同一套浮点解析），
+        # 避免 Arrow 自己的浮点解析使 1e-30 之类的值与 pandas 读入结果不一致
+        try:
+            use_cols = columns if columns is not None else names
+            table = pacsv.read_csv(
+                str(path),
+                parse_options=pacsv.ParseOptions(delimiter='\t'),
+                convert_options=pacsv.ConvertOptions(
+                    column_types={c: pa.string() for c in use_cols},
+                    strings_can_be_null=True,
+                    include_columns=use_cols,
+                ),
+            )
+            df = table.to_pandas(self_destruct=True)
+            for c in df.columns:
+                try:
+                    df[c] = pd.to_numeric(df[c])
+                except (ValueError, TypeError):
+                    pass
+            return df
+        except Exception as e:
+            print(f"[WARN] pyarrow 读取失败，回退 pandas: {path} -> {e}")
     # pandas 会根据后缀自动识别压缩；engine='c' 更快
-    return pd.read_table(path, engine='c')
+    return pd.read_table(path, engine='c', usecols=columns)
 
 
 # ------------------------------
 # Load PFAM (domtblout merged)
 # ------------------------------
 
-def load_pfam_grouped(pfam_path: Path) -> pd.DataFrame:
-    p_df = pd.read_table(pfam_path)
+def load_pfam_grouped(pfam_path: Path, flanking_ids: Optional[Iterable] = None) -> pd.DataFrame:
+    p_df = _read_tsv(pfam_path, columns=['query_name', 'target_name', 'full_seq_Evalue', 'full_seq_score'])
+    # 先按展开结果中出现的 flanking_id 过滤，再做代价较高的 groupby().agg(list)
+    if flanking_ids is not None:
+        p_df = p_df[p_df['target_name'].isin(flanking_ids)]
 
     # 重命名列
     p_df = p_df.rename(columns={
@@ -51,10 +96,10 @@ def load_pfam_grouped(pfam_path: Path) -> pd.DataFrame:
         'full_seq_score': 'pfam_score'
     })
 
-    # 保留需要的列并按 flanking_id 分组，将其余列变为 list
+    # 保留需要的列并按 flanking_id 分组，将其余列变为 list（flanking_id 作为索引）
     grouped_df = (
         p_df[['flanking_id', 'pfam_evalue', 'pfam_score', 'pfam_query_name']]
-        .groupby('flanking_id', as_index=False)
+        .groupby('flanking_id')
         .agg(list)
     )
 
@@ -66,10 +111,12 @@ def load_pfam_grouped(pfam_path: Path) -> pd.DataFrame:
 # Load eggNOG-mapper merged
 # ------------------------------
 
-def load_emapper(emapper_path: Path) -> pd.DataFrame:
-    em_df = _read_tsv(emapper_path)
+def load_emapper(emapper_path: Path, flanking_ids: Optional[Iterable] = None) -> pd.DataFrame:
     expect = ['query_name', 'evalue', 'score', 'Description', 'PFAMs',
               'sseqid', 'qstart', 'qend', 'sstart', 'send', 'pident', 'qcov', 'scov']
+    em_df = _read_tsv(emapper_path, columns=expect)
+    if flanking_ids is not None:
+        em_df = em_df[em_df['query_name'].isin(flanking_ids)]
     for c in expect:
         if c not in em_df.columns:
             em_df[c] = pd.NA
@@ -86,12 +133,12 @@ def load_emapper(emapper_path: Path) -> pd.DataFrame:
     keep = ['flanking_id', 'emapper_evalue', 'score', 'emmapper_Description', 'emmapper_PFAMs',
             'sseqid', 'emapper_protein_start', 'emapper_protein_end',
             'sstart', 'send', 'pident', 'emapper_protein_cov', 'scov']
-    # 去重以防 emapper 多次输出导致同一个 flanking_id 多行
-    return em_df[keep].drop_duplicates(subset=['flanking_id']).copy()
+    # 去重以防 emapper 多次输出导致同一个 flanking_id 多行；以 flanking_id 为唯一索引供 join 直接复用
+    return em_df[keep].drop_duplicates(subset=['flanking_id']).set_index('flanking_id')
 
 
 # ------------------------------
-# Expand step3_df flanking segments — parallel
+# Expand step3_df flanking segments
 # ------------------------------
 
 def _safe_parse_segments(x: Any) -> List:
@@ -110,48 +157,29 @@ def _safe_parse_segments(x: Any) -> List:
     return []
 
 
-def _expand_rows(rows: Iterable[Dict[str, Any]], keep_cols: List[str]) -> List[Dict[str, Any]]:
-    out: List[Dict[str, Any]] = []
-    for row in rows:
-        segs = row.get('flanking_segments', []) or []
-        for item in segs:
-            if not isinstance(item, (list, tuple)) or len(item) < 4:
-                continue
-            out.append({
-                **{c: row.get(c) for c in keep_cols},
-                'flanking_id': item[0],
-                'flanking_start': int(item[1]),
-                'flanking_end': int(item[2]),
-                'flanking_strand': int(item[3]),
-            })
-    return out
+SEG_COLS = ['flanking_id', 'flanking_start', 'flanking_end', 'flanking_strand']
 
 
 def expand_step3_parallel(step3_df: pd.DataFrame, keep_cols: List[str], workers: int = 1, chunksize: int = 5000) -> pd.DataFrame:
-    step3_df = step3_df.copy()
-    step3_df['flanking_segments'] = step3_df['flanking_segments'].apply(_safe_parse_segments)
-
-    if workers <= 1 or len(step3_df) <= chunksize:
-        rows = step3_df.to_dict('records')
-        expanded = _expand_rows(rows, keep_cols)
-        return pd.DataFrame(expanded)
-
-    # 分块
-    n = len(step3_df)
-    n_chunks = math.ceil(n / chunksize)
-    futures = []
-    with ProcessPoolExecutor(max_workers=workers) as ex:
-        for i in range(n_chunks):
-            start = i * chunksize
-            end = min((i + 1) * chunksize, n)
-            chunk_rows = step3_df.iloc[start:end].to_dict('records')
-            futures.append(ex.submit(_expand_rows, chunk_rows, keep_cols))
-        expanded_parts: List[List[Dict[str, Any]]] = []
-        for fut in as_completed(futures):
-            expanded_parts.append(fut.result())
-    # 合并
-    flat: List[Dict[str, Any]] = [r for part in expanded_parts for r in part]
-    return pd.DataFrame(flat)
+    """explode 成每个片段一行，再把 (id, start, end, strand) 一次性展开成列。
+    单进程向量化即可，进程池按块 pickle 行字典的开销远大于展开本身；workers / chunksize 仅为兼容旧命令行保留"""
+    # 只取需要的列组成新表，解析后的片段直接写入其中，不整表 copy、也不改动调用方的 step3_df；
+    # 不存在的 keep_cols 与原逐行版本一致，输出为空列
+    expanded = step3_df.reindex(columns=keep_cols)
+    expanded['flanking_segments'] = step3_df['flanking_segments'].map(_safe_parse_segments)
+    expanded = expanded.explode('flanking_segments', ignore_index=True)
+    valid = expanded['flanking_segments'].map(lambda x: isinstance(x, (list, tuple)) and len(x) >= 4).astype(bool)
+    expanded = expanded[valid.to_numpy()].reset_index(drop=True)
+    # 按列转置成 4 个并行列表（struct-of-arrays），直接建列，不经过逐行 list 的二维 object 中间表
+    segs = expanded['flanking_segments'].tolist()
+    ids, starts, ends, strands = zip(*(item[:4] for item in segs)) if segs else ((), (), (), ())
+    seg = pd.DataFrame({
+        'flanking_id': list(ids),
+        'flanking_start': np.asarray(starts, dtype='int64'),
+        'flanking_end': np.asarray(ends, dtype='int64'),
+        'flanking_strand': np.asarray(strands, dtype='int64'),
+    }, columns=SEG_COLS)
+    return pd.concat([expanded.drop(columns='flanking_segments'), seg], axis=1, copy=False)
 
 
 # ------------------------------
@@ -159,22 +187,14 @@ def expand_step3_parallel(step3_df: pd.DataFrame, keep_cols: List[str], workers:
 # ------------------------------
 
 def add_relative_distance(df_expanded: pd.DataFrame) -> pd.DataFrame:
-    # 向量化计算，避免逐行 apply
-    ps = pd.to_numeric(df_expanded['prot_start'], errors='coerce')
-    pe = pd.to_numeric(df_expanded['prot_end'], errors='coerce')
-    fs = pd.to_numeric(df_expanded['flanking_start'], errors='coerce')
-    fe = pd.to_numeric(df_expanded['flanking_end'], errors='coerce')
-
-    # 默认 0（重叠）
-    rel = pd.Series(0, index=df_expanded.index, dtype='int64')
-    # 上游：fe < ps -> fe - ps
-    mask_up = (fe < ps)
-    rel.loc[mask_up] = (fe - ps)[mask_up]
-    # 下游：fs > pe -> fs - pe
-    mask_down = (fs > pe)
-    rel.loc[mask_down] = (fs - pe)[mask_down]
-
-    df_expanded['relative_distance'] = rel
+    # 向量化计算：坐标列一次性转成 int64 数组（缺失/非数值直接报错），两层 np.where 完成分类
+    # 上游为 flanking_end - prot_start（负），下游为 flanking_start - prot_end（正），重叠为 0
+    ps = df_expanded['prot_start'].to_numpy(dtype='int64')
+    pe = df_expanded['prot_end'].to_numpy(dtype='int64')
+    fs = df_expanded['flanking_start'].to_numpy(dtype='int64')
+    fe = df_expanded['flanking_end'].to_numpy(dtype='int64')
+
+    df_expanded['relative_distance'] = np.where(fe < ps, fe - ps, np.where(fs > pe, fs - pe, 0))
     return df_expanded
 
 
@@ -183,15 +203,15 @@ def add_relative_distance(df_expanded: pd.DataFrame) -> pd.DataFrame:
 # ------------------------------
 
 def main():
-    ap = argparse.ArgumentParser(description='Integrate PFAM & eggNOG-mapper annotations onto flanking segments table (multi-processing).')
+    ap = argparse.ArgumentParser(description='Integrate PFAM & eggNOG-mapper annotations onto flanking segments table.')
     ap.add_argument('--pfam', required=True, help='PFAM merged TSV (from domtblout integration)')
-    ap.add_argument('--emapper', required=True, help='eggNOG-mapper merged TSV (from S6)')
+    ap.add_argument('--emapper', required=True, help='eggNOG-mapper merged TSV or .parquet (from S6)')
     ap.add_argument('--step3-df', required=True, help='Step3 dataframe TSV with flanking_segments column')
     ap.add_argument('-o', '--out', required=True, help='Output TSV path')
     ap.add_argument('--keep-cols', default='target_name,target_file,prot_start,prot_end,source',
                     help='Comma-separated columns to keep from step3_df (default matches original)')
-    ap.add_argument('--workers', type=int, default=32, help='并行进程数（>1 开启分块并行）')
-    ap.add_argument('--chunksize', type=int, default=5000, help='每个进程处理的行数块大小（默认 5000）')
+    ap.add_argument('--workers', type=int, default=32, help='已弃用：展开改为单进程向量化，仅为兼容旧命令行保留')
+    ap.add_argument('--chunksize', type=int, default=5000, help='已弃用：仅为兼容旧命令行保留')
     args = ap.parse_args()
 
     pfam_path = Path(args.pfam)
@@ -202,30 +222,32 @@ def main():
 
     keep_cols = [c.strip() for c in args.keep_cols.split(',') if c.strip()]
 
-    # 1) 读 & 重命名
-    p_df = load_pfam_grouped(pfam_path)
-    e_df = load_emapper(emapper_path)
-
-    # 2) 读 step3 & 并行展开
-    step3_df = _read_tsv(step3_path)
+    # 1) 读 step3（只读需要的列）& 展开
+    step3_df = _read_tsv(step3_path, columns=keep_cols + ['flanking_segments'])
     if 'flanking_segments' not in step3_df.columns:
         raise ValueError("Input step3_df missing column: flanking_segments")
     expanded = expand_step3_parallel(step3_df, keep_cols, workers=args.workers, chunksize=args.chunksize)
+    del step3_df
 
     if expanded.empty:
         print('[WARN] 展开结果为空，仍将写出含表头的空文件。')
         expanded.to_csv(out_path, sep='\t', index=False)
         return
 
+    # 2) 读 PFAM / emapper & 重命名：只保留展开结果中出现的 flanking_id
+    flanking_ids = pd.unique(expanded['flanking_id'])
+    p_df = load_pfam_grouped(pfam_path, flanking_ids)
+    e_df = load_emapper(emapper_path, flanking_ids)
+
     # 3) 相对距离
     expanded = add_relative_distance(expanded)
 
-    # 4) 合并 emapper / pfam（按 flanking_id 左连接）
-    out = expanded.merge(
-        e_df[['flanking_id', 'emapper_evalue', 'emapper_protein_start', 'emapper_protein_end', 'emapper_protein_cov','emmapper_PFAMs', 'emmapper_Description']],
+    # 4) 合并 emapper / pfam（按 flanking_id 左连接；两表已以 flanking_id 为索引，join 不再重复建键）
+    out = expanded.join(
+        e_df[['emapper_evalue', 'emapper_protein_start', 'emapper_protein_end', 'emapper_protein_cov','emmapper_PFAMs', 'emmapper_Description']],
         on='flanking_id', how='left'
-    ).merge(
-        p_df[['flanking_id', 'pfam_evalue', 'pfam_score', 'pfam_query_name']],
+    ).join(
+        p_df[['pfam_evalue', 'pfam_score', 'pfam_query_name']],
         on='flanking_id', how='left'
     )
 
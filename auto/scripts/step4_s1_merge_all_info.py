@@ -2,7 +2,7 @@
 import argparse
 import pandas as pd
 import os
-from Bio import SeqIO
+from Bio.SeqIO.FastaIO import SimpleFastaParser
 
 
 def get_repseq_for_round(df, cluster_file, round_num, identity_thresholds):
@@ -12,10 +12,10 @@ def get_repseq_for_round(df, cluster_file, round_num, identity_thresholds):
         clustering_seqid = f'cluster_{identity_thresholds[round_num - 1]}_repseq'
 
     cluster_df = pd.read_table(cluster_file, header=None, names=['repseq_id', 'seqid'])
-    df_merged = pd.merge(df, cluster_df, left_on=clustering_seqid, right_on='seqid', how='left')
-    df_merged.rename(columns={'repseq_id': f'cluster_{identity_thresholds[round_num]}_repseq'}, inplace=True)
-    df_merged.drop(columns=['seqid'], inplace=True)
-    return df_merged
+    # MMseqs 的 cluster.tsv 中每个 seqid 只出现一次：用 seqid -> repseq 字典直接 map 成新列，不经过 merge 中间表
+    cluster_map = dict(zip(cluster_df['seqid'], cluster_df['repseq_id']))
+    df[f'cluster_{identity_thresholds[round_num]}_repseq'] = df[clustering_seqid].map(cluster_map)
+    return df
 
 
 def process_clusters(input_dir, df, identity_thresholds):
@@ -29,15 +29,17 @@ def process_clusters(input_dir, df, identity_thresholds):
 
 def add_sequence_column(df, fasta_path):
     print(f"[INFO] 正在从 {fasta_path} 加载序列...")
-    seq_dict = SeqIO.to_dict(SeqIO.parse(fasta_path, "fasta"))
-    missing = 0
-    seqs = []
-    for name in df["target_name"]:
-        if name in seq_dict:
-            seqs.append(str(seq_dict[name].seq))
-        else:
-            seqs.append("")
-            missing += 1
+    # 只保留 df 中出现的 target_name：SimpleFastaParser 流式扫描，不构造 SeqRecord，
+    # 内存只与目标条数相关，而不是整个 FASTA
+    wanted = set(df["target_name"].dropna())
+    seq_dict = {}
+    with open(fasta_path, 'r') as handle:
+        for title, seq in SimpleFastaParser(handle):
+            rec_id = title.split(None, 1)[0] if title else ''
+            if rec_id in wanted and rec_id not in seq_dict:
+                seq_dict[rec_id] = seq
+    seqs = [seq_dict.get(name, "") for name in df["target_name"]]
+    missing = sum(1 for name in df["target_name"] if name not in seq_dict)
     if missing > 0:
         print(f"[WARN] 有 {missing} 个 target_name 在 fasta 中未找到序列")
     df["seq"] = seqs
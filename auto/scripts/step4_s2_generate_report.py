@@ -1,13 +1,18 @@
 #!/usr/bin/env python3
 import argparse
 import os
+import numpy as np
 import pandas as pd
-import math
+from concurrent.futures import ThreadPoolExecutor
 
 def split_dataframe(df, num_parts):
-    """将 DataFrame 平均拆分为 num_parts 个子 DataFrame"""
-    chunk_size = math.ceil(len(df) / num_parts)
-    return [df.iloc[i * chunk_size: (i + 1) * chunk_size] for i in range(num_parts)]
+    """将 DataFrame 平均拆分为 num_parts 个子 DataFrame（np.array_split 切分行位置，余数摊到前几块，各块为 iloc 视图）"""
+    return [df.iloc[idx[0]: idx[-1] + 1] if len(idx) else df.iloc[0:0]
+            for idx in np.array_split(np.arange(len(df)), num_parts)]
+
+def _write_chunk(chunk, output_path):
+    chunk.to_csv(output_path, sep='\t', index=False)
+    return output_path, len(chunk)
 
 def main():
     parser = argparse.ArgumentParser(description="将一个 DataFrame 平均拆分为多个部分")
@@ -23,10 +28,11 @@ def main():
 
     chunks = split_dataframe(df, args.num_parts)
 
-    for idx, chunk in enumerate(chunks):
-        output_path = os.path.join(args.output_dir, f"{args.prefix}_{idx+1}.tsv")
-        chunk.to_csv(output_path, sep='\t', index=False)
-        print(f"✅ Saved: {output_path} ({len(chunk)} rows)")
+    # 各块写不同文件，线程并发写出以重叠磁盘 I/O
+    output_paths = [os.path.join(args.output_dir, f"{args.prefix}_{idx+1}.tsv") for idx in range(len(chunks))]
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(chunks)))) as executor:
+        for output_path, n_rows in executor.map(_write_chunk, chunks, output_paths):
+            print(f"✅ Saved: {output_path} ({n_rows} rows)")
 
 if __name__ == "__main__":
     main()
@@ -1,7 +1,22 @@
 import re
+from functools import lru_cache
+import numpy as np
 import pandas as pd
 import os
 
+# CRT 解析用到的正则统一在模块级预编译（re.ASCII：输出全为 ASCII，\d / \s 走快速路径）
+_ORG_RE = re.compile(r'^ORGANISM:\s+(\S+)', re.ASCII)
+_CRISPR_RE = re.compile(r'^CRISPR\s+(\d+)\s+Range:\s*(\d+)\s*-\s*(\d+)', re.ASCII)
+_TABLE_HEADER_RE = re.compile(r'^POSITION\s+REPEAT\s+SPACER', re.ASCII)
+_SEP_RE = re.compile(r'^-+')
+_STATS_RE = re.compile(r'Repeats:\s*(\d+)\s+Average Length:\s*(\d+)\s+Average Length:\s*(\d+)', re.ASCII)
+# CRT 表格行按 2 个以上空白或制表符切分；spacer 长度列只取数字
+_SPLIT_RE = re.compile(r'\s{2,}|\t', re.ASCII)
+_DIGITS_RE = re.compile(r'\d+', re.ASCII)
+
+CRT_COLUMNS = ['genome', 'crispr_num', 'crispr_start', 'crispr_end', 'position', 'repeat_seq', 'spacer_seq',
+               'spacer_lengths', 'repeat_count', 'repeat_avg_len', 'spacer_avg_len']
+
 def get_repseq_for_round(df, cluster_file, round_num, identity_thresholds):
     # 读取当前轮次的_cluster.tsv文件
     if round_num == 0:
@@ -10,11 +25,10 @@ def get_repseq_for_round(df, cluster_file, round_num, identity_thresholds):
         clustering_seqid = f'cluster_{identity_thresholds[round_num-1]}_repseq'
     cluster_df = pd.read_table(cluster_file, header=None, names=['repseq_id', 'seqid'])
 
-    df_merged = pd.merge(df, cluster_df, left_on=clustering_seqid, right_on='seqid', how='left')
-
-    df_merged.rename(columns={'repseq_id': f'cluster_{identity_thresholds[round_num]}_repseq'}, inplace=True)
-    df_merged.drop(columns=['seqid'], inplace=True)
-    return df_merged
+    # MMseqs 的 cluster.tsv 中每个 seqid 只出现一次：用 seqid -> repseq 字典直接 map 成新列，不经过 merge 中间表
+    cluster_map = dict(zip(cluster_df['seqid'], cluster_df['repseq_id']))
+    df[f'cluster_{identity_thresholds[round_num]}_repseq'] = df[clustering_seqid].map(cluster_map)
+    return df
 
 def process_clusters(input_dir, df, identity_thresholds):
     for round_num, identity in enumerate(identity_thresholds):
@@ -29,7 +43,7 @@ def parse_crispr_file(filepath):
         lines = f.readlines()
 
     organism = None
-    crispr_list = []
+    columns = {col: [] for col in CRT_COLUMNS}
     current_crispr = None
     inside_table = False
     table_lines = []
@@ -39,16 +53,16 @@ def parse_crispr_file(filepath):
         line = line.rstrip('\n')
 
         # ORGANISM
-        m_org = re.match(r'^ORGANISM:\s+(\S+)', line)
+        m_org = _ORG_RE.match(line)
         if m_org:
             organism = m_org.group(1)
             continue
 
         # CRISPR 开头
-        m_crispr = re.match(r'^CRISPR\s+(\d+)\s+Range:\s*(\d+)\s*-\s*(\d+)', line)
+        m_crispr = _CRISPR_RE.match(line)
         if m_crispr:
             if current_crispr and table_lines:
-                crispr_list.extend(parse_crispr_table(current_crispr, table_lines, organism, repeat_info))
+                parse_crispr_table(current_crispr, table_lines, organism, repeat_info, columns)
                 table_lines = []
                 repeat_info = None
 
@@ -60,16 +74,16 @@ def parse_crispr_file(filepath):
             inside_table = False
             continue
 
-        if re.match(r'^POSITION\s+REPEAT\s+SPACER', line):
+        if _TABLE_HEADER_RE.match(line):
             inside_table = True
             continue
 
         if inside_table:
-            if re.match(r'^-+', line):
+            if _SEP_RE.match(line):
                 continue
             # Repeats: 6	Average Length: 35		Average Length: 28
             if line.startswith('Repeats:'):
-                m_stats = re.search(r'Repeats:\s*(\d+)\s+Average Length:\s*(\d+)\s+Average Length:\s*(\d+)', line.replace('\t', ' '))
+                m_stats = _STATS_RE.search(line.replace('\t', ' '))
                 if m_stats:
                     repeat_info = {
                         'repeat_count': int(m_stats.group(1)),
@@ -81,46 +95,90 @@ def parse_crispr_file(filepath):
 
     # 文件末尾最后一个CRISPR区块处理
     if current_crispr and table_lines:
-        crispr_list.extend(parse_crispr_table(current_crispr, table_lines, organism, repeat_info))
-
-    return pd.DataFrame(crispr_list)
-
-def parse_crispr_table(crispr_info, lines, organism, repeat_info=None):
-    records = []
+        parse_crispr_table(current_crispr, table_lines, organism, repeat_info, columns)
+
+    # 无记录时保持与原来一致的空表（无列）
+    if not columns['position']:
+        return pd.DataFrame()
+    return pd.DataFrame(columns, columns=CRT_COLUMNS)
+
+def parse_crispr_table(crispr_info, lines, organism, repeat_info=None, columns=None):
+    """逐行只做一次切分，结果按列追加到 columns（列名 -> list），不再为每行构造 dict；
+    columns 为空时新建并返回，由调用方最后一次性构造 DataFrame"""
+    if columns is None:
+        columns = {col: [] for col in CRT_COLUMNS}
+    positions, repeats, spacers, spacer_lengths_col = [], [], [], []
     for line in lines:
-        parts = re.split(r'\s{2,}|\t', line.strip())
+        parts = _SPLIT_RE.split(line.strip())
         if len(parts) < 2:
             continue
-        position = parts[0]
-        repeat = parts[1]
-        spacer = parts[2] if len(parts) > 2 else ''
+        positions.append(int(parts[0]))
+        repeats.append(parts[1])
+        spacers.append(parts[2] if len(parts) > 2 else '')
         spacer_lengths = None
         if len(parts) > 3:
-            m = re.findall(r'\d+', parts[3])
-            spacer_lengths = list(map(int, m)) if m else None
-
-        record = {
-            'genome': organism,
-            'crispr_num': crispr_info['crispr_num'],
-            'crispr_start': crispr_info['start'],
-            'crispr_end': crispr_info['end'],
-            'position': int(position),
-            'repeat_seq': repeat,
-            'spacer_seq': spacer,
-            'spacer_lengths': spacer_lengths,
-            'repeat_count': repeat_info['repeat_count'] if repeat_info else None,
-            'repeat_avg_len': repeat_info['repeat_avg_len'] if repeat_info else None,
-            'spacer_avg_len': repeat_info['spacer_avg_len'] if repeat_info else None,
-        }
-        records.append(record)
-    return records
+            m = _DIGITS_RE.findall(parts[3])
+            spacer_lengths = tuple(map(int, m)) if m else None
+        spacer_lengths_col.append(spacer_lengths)
+
+    # 同一 CRISPR 区块内的常量列直接按行数整段扩展
+    n = len(positions)
+    columns['genome'].extend([organism] * n)
+    columns['crispr_num'].extend([crispr_info['crispr_num']] * n)
+    columns['crispr_start'].extend([crispr_info['start']] * n)
+    columns['crispr_end'].extend([crispr_info['end']] * n)
+    columns['position'].extend(positions)
+    columns['repeat_seq'].extend(repeats)
+    columns['spacer_seq'].extend(spacers)
+    columns['spacer_lengths'].extend(spacer_lengths_col)
+    columns['repeat_count'].extend([repeat_info['repeat_count'] if repeat_info else None] * n)
+    columns['repeat_avg_len'].extend([repeat_info['repeat_avg_len'] if repeat_info else None] * n)
+    columns['spacer_avg_len'].extend([repeat_info['spacer_avg_len'] if repeat_info else None] * n)
+    return columns
+
+@lru_cache(maxsize=128)
+def _cached_parse(crt_file_path):
+    """同一 CRT 文件只解析一次，并预先建好 genome -> 行位置 的索引；
+    lru_cache 限制驻留的文件数，调用方不得修改返回的 DataFrame"""
+    crt_df = parse_crispr_file(crt_file_path)
+    genome_index = crt_df.groupby('genome', sort=False).indices if len(crt_df) != 0 else {}
+    return crt_df, genome_index
+
+_EMPTY_IDX = np.empty(0, dtype=np.intp)
+
+def _match_genome_rows(genome_index, genome):
+    """按 genome 索引取行位置：与 genome 完全相同的行在前，其余 genome 子串的行按原顺序在后，
+    与原先 concat([完全匹配, 子串匹配]) 的顺序一致；子串判断只对去重后的 genome 做一次"""
+    exact = genome_index.get(genome, _EMPTY_IDX)
+    partial = [idx for g, idx in genome_index.items() if g in genome]
+    partial = np.sort(np.concatenate(partial)) if partial else _EMPTY_IDX
+    return np.concatenate([exact, partial])
+
+def _crispr_blocks(crt_df, genome_index, genome):
+    """genome 对应的 CRISPR 区块（按 crispr_num 排序）：起点最小值、终点最大值数组与各区块的行"""
+    # 筛选子集，crt_df['genome']必须是genome的子串
+    sub_df = crt_df.take(_match_genome_rows(genome_index, genome)).reset_index(drop=True)
+    sub_df = sub_df.drop_duplicates()
+    groups = [crispr_group for _, crispr_group in sub_df.groupby('crispr_num')]
+    starts = np.array([g['crispr_start'].min() for g in groups], dtype=np.int64)
+    ends = np.array([g['crispr_end'].max() for g in groups], dtype=np.int64)
+    return starts, ends, groups
 
 def batch_process_crispr_files(df, crt_file_dir, crispr_distance=10000):
-    updated_crispr_dfs = []
+    updated_crispr_dfs = []  # (行位置, crispr_group)，最后按行位置排序，保持逐行处理时的输出顺序
+    # 结果先写入按位置对齐的 object 数组，循环结束后一次性赋给 df，避免逐行 df.at 触发类型升级
+    if 'crispr_coords' in df.columns:
+        crispr_coords_out = df['crispr_coords'].to_numpy(dtype=object, copy=True)
+    else:
+        crispr_coords_out = np.full(len(df), np.nan, dtype=object)
+
+    target_names = df['target_name'].tolist()
+    prot_starts = df['prot_start'].tolist()
+    prot_ends = df['prot_end'].tolist()
 
-    for index, row in df.iterrows():
-        target_file = row['target_file'].replace('.domtblout', '')
-        source = row['source']
+    # 按 (target_file, source) 分组：每个 CRT 文件只定位、检查、解析一次，组内同一 genome 的区块也只筛选一次
+    for (target_file, source), positions in df.groupby(['target_file', 'source'], sort=False).indices.items():
+        target_file = target_file.replace('.domtblout', '')
 
         # 生成crt文件对应的base_name
         if 'phage' in source:
@@ -134,55 +192,55 @@ def batch_process_crispr_files(df, crt_file_dir, crispr_distance=10000):
 
         # 文件存在检查，避免出错
         if not os.path.isfile(crt_file_path):
-            print(f"[警告] 缺失CRISPR文件：{crt_file_path}，跳过该条记录")
+            print(f"[警告] 缺失CRISPR文件：{crt_file_path}，跳过 {len(positions)} 条记录")
             continue
 
-        crt_df = parse_crispr_file(crt_file_path)
-        if len(crt_df) != 0:
+        crt_df, genome_index = _cached_parse(crt_file_path)
+        if len(crt_df) == 0:
+            crispr_coords_out[positions] = ''
+            continue
+
+        blocks_by_genome = {}
+        for i in positions:
             # genome字符串处理
-            if 'IMGM_meta' in row['source']:
-                genome = row['target_name'].values
+            if 'IMGM_meta' in source:
+                genome = target_names[i].values
             else:
-                genome = "_".join(row['target_name'].split('_')[:-1])
-
-            # 筛选子集，crt_df['genome']必须是genome的子串
-            sub_df2 = crt_df[crt_df['genome'].apply(lambda x: x in genome)]
-            sub_df1 = crt_df[crt_df['genome'] == genome]
-            sub_df = pd.concat([sub_df1, sub_df2], ignore_index=True)
-            sub_df = sub_df.applymap(lambda x: str(x) if isinstance(x, list) else x)
-            sub_df = sub_df.drop_duplicates()
-
-            crispr_coords = []
-            print(len(sub_df))
-            prot_start = row['prot_start']
-            prot_end = row['prot_end']
-            prot_id = row['target_name']
+                genome = "_".join(target_names[i].split('_')[:-1])
+            if genome not in blocks_by_genome:
+                blocks_by_genome[genome] = _crispr_blocks(crt_df, genome_index, genome)
+            starts, ends, groups = blocks_by_genome[genome]
+
+            prot_start = prot_starts[i]
+            prot_end = prot_ends[i]
+            prot_id = target_names[i]
             window_start = prot_start - crispr_distance
             window_end = prot_end + crispr_distance
 
-            for crispr_num, crispr_group in sub_df.groupby('crispr_num'):
-                crispr_start = crispr_group['crispr_start'].min()
-                crispr_end = crispr_group['crispr_end'].max()
-
-                # 判断CRISPR是否在蛋白上下游crispr_distance范围内
-                if window_start <= crispr_end and crispr_start <= window_end:
-                    crispr_group = crispr_group.copy()
-                    crispr_group['prot_start'] = prot_start
-                    crispr_group['prot_end'] = prot_end
-                    crispr_group['prot_id'] = prot_id
+            # 判断CRISPR是否在蛋白上下游crispr_distance范围内（对该 genome 的全部区块一次性比较）
+            hits = np.flatnonzero((window_start <= ends) & (starts <= window_end))
+            crispr_coords = []
+            for k in hits:
+                crispr_group = groups[k].copy()
+                crispr_group['prot_start'] = prot_start
+                crispr_group['prot_end'] = prot_end
+                crispr_group['prot_id'] = prot_id
 
-                    updated_crispr_dfs.append(crispr_group)
-                    crispr_coords.append(f"{crispr_start}-{crispr_end}")
+                updated_crispr_dfs.append((i, crispr_group))
+                crispr_coords.append(f"{starts[k]}-{ends[k]}")
 
             if crispr_coords:
                 crispr_summary = ";".join(crispr_coords)
-                df.at[index, 'crispr_coords'] = crispr_summary
-        else:
-            df.at[index, 'crispr_coords'] = ''
+                crispr_coords_out[i] = crispr_summary
 
+    df['crispr_coords'] = crispr_coords_out
 
     if updated_crispr_dfs:
-        res_crispr_df = pd.concat(updated_crispr_dfs, ignore_index=True)
+        updated_crispr_dfs.sort(key=lambda item: item[0])
+        res_crispr_df = pd.concat([crispr_group for _, crispr_group in updated_crispr_dfs], ignore_index=True)
+        # spacer_lengths 以 tuple 保存（可哈希，drop_duplicates 无需逐格转字符串），输出时还原为原来的 '[a, b]' 格式
+        res_crispr_df['spacer_lengths'] = res_crispr_df['spacer_lengths'].map(
+            lambda x: str(list(x)) if isinstance(x, tuple) else x)
     else:
         res_crispr_df = pd.DataFrame()
 